@@ -23,6 +23,9 @@ DB_USER = os.getenv("DB_USER", "")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_NAMESPACE = os.getenv("DB_NAMESPACE", "rainbow")
 DB_DATABASE = os.getenv("DB_DATABASE", "dialogue")
+DB_SEM_PER_REQ = int(os.getenv("DB_SEM_PER_REQ", "4"))  # 单个请求的最大并发数据库操作数
+DB_CACHE_TTL = float(os.getenv("DB_CACHE_TTL", "2"))  # 实体读缓存有效期（秒），多进程部署时应保持较短
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "10000"))  # 实体读缓存最大条目数
 
 # LLM配置
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "mock")  # mock, openai, azure
@@ -69,7 +72,10 @@ def get_config() -> Dict[str, Any]:
             "user": DB_USER,
             "password": DB_PASSWORD,
             "namespace": DB_NAMESPACE,
-            "database": DB_DATABASE
+            "database": DB_DATABASE,
+            "sem_per_request": DB_SEM_PER_REQ,
+            "cache_ttl": DB_CACHE_TTL,
+            "cache_size": DB_CACHE_SIZE
         },
         "llm": {
             "provider": LLM_PROVIDER,
@@ -119,6 +125,9 @@ class Settings:
         self.DB_PASSWORD = DB_PASSWORD
         self.DB_NAMESPACE = DB_NAMESPACE
         self.DB_DATABASE = DB_DATABASE
+        self.DB_SEM_PER_REQ = DB_SEM_PER_REQ
+        self.DB_CACHE_TTL = DB_CACHE_TTL
+        self.DB_CACHE_SIZE = DB_CACHE_SIZE
         
         # LLM配置
         self.LLM_PROVIDER = LLM_PROVIDER
@@ -18,8 +18,8 @@ class DialogueTypes:
     AI_SELF = "ai_self"                          # AI ⇄ 自我（自省/觉知）
     AI_MULTI_HUMAN = "ai_multi_human"            # AI ⇄ 多人类 群组
     
-    # 所有对话类型列表
-    ALL = [
+    # 所有对话类型集合
+    ALL = frozenset((
         HUMAN_HUMAN_PRIVATE,
         HUMAN_HUMAN_GROUP,
         HUMAN_AI,
@@ -27,32 +27,32 @@ class DialogueTypes:
         AI_AI,
         AI_SELF,
         AI_MULTI_HUMAN
-    ]
+    ))
     
     # 人类参与的对话类型
-    HUMAN_INVOLVED = [
+    HUMAN_INVOLVED = frozenset((
         HUMAN_HUMAN_PRIVATE,
         HUMAN_HUMAN_GROUP,
         HUMAN_AI,
         HUMAN_AI_GROUP,
         AI_MULTI_HUMAN
-    ]
+    ))
     
     # AI参与的对话类型
-    AI_INVOLVED = [
+    AI_INVOLVED = frozenset((
         HUMAN_AI,
         HUMAN_AI_GROUP,
         AI_AI,
         AI_SELF,
         AI_MULTI_HUMAN
-    ]
+    ))
     
     # 群组对话类型
-    GROUP_TYPES = [
+    GROUP_TYPES = frozenset((
         HUMAN_HUMAN_GROUP,
         HUMAN_AI_GROUP,
         AI_MULTI_HUMAN
-    ]
+    ))
 
 
 # 会话类型常量
@@ -12,6 +12,32 @@ import aiohttp
 
 from ..config import get_config
 
+# 未注入会话时各LLM客户端共用的HTTP会话（首次请求时创建），复用连接池
+_shared_session: Optional[aiohttp.ClientSession] = None
+
+
+def _get_shared_session() -> aiohttp.ClientSession:
+    """
+    获取共享的HTTP会话，不存在或已关闭时创建
+    
+    Returns:
+        HTTP会话
+    """
+    global _shared_session
+    if _shared_session is None or _shared_session.closed:
+        _shared_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=30)
+        )
+    return _shared_session
+
+
+async def close_shared_session() -> None:
+    """关闭共享的HTTP会话（应用关闭时调用）"""
+    global _shared_session
+    if _shared_session is not None and not _shared_session.closed:
+        await _shared_session.close()
+    _shared_session = None
+
 
 class BaseLLMClient:
     """LLM客户端基类"""
@@ -153,13 +179,24 @@ class MockLLMClient(BaseLLMClient):
 class OpenAIClient(BaseLLMClient):
     """OpenAI API客户端"""
     
-    def __init__(self):
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
+        """
+        初始化OpenAI客户端
+        
+        Args:
+            session: HTTP会话，为None时使用模块共享的会话
+        """
         super().__init__()
+        self._session = session
         self.api_key = self.config["api_key"]
         self.api_url = self.config.get("api_url", "https://api.openai.com/v1")
         self.model = self.config.get("model", "gpt-3.5-turbo")
         self.stream_chunk_size = self.config.get("stream_chunk_size", 10)  # 流式响应块大小
     
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取发送请求使用的HTTP会话"""
+        return self._session or _get_shared_session()
+    
     async def _generate_logic(self, prompt: str, **kwargs) -> Dict[str, Any]:
         """调用OpenAI API生成响应"""
         if not self.api_key:
@@ -197,26 +234,26 @@ class OpenAIClient(BaseLLMClient):
             "Authorization": f"Bearer {self.api_key}"
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.api_url}/chat/completions",
-                headers=headers,
-                json=data
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    self.logger.error(f"OpenAI API error: {response.status} - {error_text}")
-                    raise ValueError(f"OpenAI API error: {response.status} - {error_text}")
-                
-                result = await response.json()
-                
-                # 处理响应
-                return {
-                    "id": result.get("id", ""),
-                    "created": datetime.fromtimestamp(result.get("created", datetime.utcnow().timestamp())).isoformat(),
-                    "content": result.get("choices", [{}])[0].get("message", {}).get("content", ""),
-                    "usage": result.get("usage", {})
-                }
+        session = self._get_session()
+        async with session.post(
+            f"{self.api_url}/chat/completions",
+            headers=headers,
+            json=data
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                self.logger.error(f"OpenAI API error: {response.status} - {error_text}")
+                raise ValueError(f"OpenAI API error: {response.status} - {error_text}")
+            
+            result = await response.json()
+            
+            # 处理响应
+            return {
+                "id": result.get("id", ""),
+                "created": datetime.fromtimestamp(result.get("created", datetime.utcnow().timestamp())).isoformat(),
+                "content": result.get("choices", [{}])[0].get("message", {}).get("content", ""),
+                "usage": result.get("usage", {})
+            }
     
     async def _generate_stream_logic(self, prompt: str, **kwargs) -> AsyncGenerator[Dict[str, Any], None]:
         """流式调用OpenAI API生成响应"""
@@ -257,62 +294,62 @@ class OpenAIClient(BaseLLMClient):
             "Authorization": f"Bearer {self.api_key}"
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.api_url}/chat/completions",
-                headers=headers,
-                json=data
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    self.logger.error(f"OpenAI API error: {response.status} - {error_text}")
-                    raise ValueError(f"OpenAI API error: {response.status} - {error_text}")
-                
-                # 处理流式响应
-                buffer = ""
-                async for line in response.content.iter_chunked(1024):
-                    line = line.decode('utf-8')
-                    if line.startswith('data: '):
-                        line = line[6:]
-                        if line.strip() == '[DONE]':
-                            break
-                        
-                        try:
-                            chunk_data = json.loads(line)
-                            if chunk_data.get("choices") and len(chunk_data["choices"]) > 0:
-                                delta = chunk_data["choices"][0].get("delta", {})
-                                chunk_content = delta.get("content", "")
+        session = self._get_session()
+        async with session.post(
+            f"{self.api_url}/chat/completions",
+            headers=headers,
+            json=data
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                self.logger.error(f"OpenAI API error: {response.status} - {error_text}")
+                raise ValueError(f"OpenAI API error: {response.status} - {error_text}")
+            
+            # 处理流式响应
+            buffer = ""
+            async for line in response.content.iter_chunked(1024):
+                line = line.decode('utf-8')
+                if line.startswith('data: '):
+                    line = line[6:]
+                    if line.strip() == '[DONE]':
+                        break
+                    
+                    try:
+                        chunk_data = json.loads(line)
+                        if chunk_data.get("choices") and len(chunk_data["choices"]) > 0:
+                            delta = chunk_data["choices"][0].get("delta", {})
+                            chunk_content = delta.get("content", "")
+                            
+                            if chunk_content:
+                                buffer += chunk_content
                                 
-                                if chunk_content:
-                                    buffer += chunk_content
-                                    
-                                    # 当缓冲区达到一定大小时，发送一个块
-                                    if len(buffer) >= self.stream_chunk_size:
-                                        yield {
-                                            "id": chunk_data.get("id", ""),
-                                            "created": datetime.utcnow().isoformat(),
-                                            "content": buffer,
-                                            "is_complete": False
-                                        }
-                                        buffer = ""
-                        except json.JSONDecodeError:
-                            self.logger.warning(f"Failed to parse JSON from stream: {line}")
-                
-                # 发送剩余的缓冲区内容
-                if buffer:
-                    yield {
-                        "id": f"final-{datetime.utcnow().timestamp()}",
-                        "created": datetime.utcnow().isoformat(),
-                        "content": buffer,
-                        "is_complete": True
-                    }
+                                # 当缓冲区达到一定大小时，发送一个块
+                                if len(buffer) >= self.stream_chunk_size:
+                                    yield {
+                                        "id": chunk_data.get("id", ""),
+                                        "created": datetime.utcnow().isoformat(),
+                                        "content": buffer,
+                                        "is_complete": False
+                                    }
+                                    buffer = ""
+                    except json.JSONDecodeError:
+                        self.logger.warning(f"Failed to parse JSON from stream: {line}")
+            
+            # 发送剩余的缓冲区内容
+            if buffer:
+                yield {
+                    "id": f"final-{datetime.utcnow().timestamp()}",
+                    "created": datetime.utcnow().isoformat(),
+                    "content": buffer,
+                    "is_complete": True
+                }
 
 
 class AzureOpenAIClient(OpenAIClient):
     """Azure OpenAI API客户端"""
     
-    def __init__(self):
-        super().__init__()
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
+        super().__init__(session)
         self.api_url = self.config.get("api_url", "")
         if not self.api_url:
             raise ValueError("Azure OpenAI API URL not configured")
@@ -353,26 +390,26 @@ class AzureOpenAIClient(OpenAIClient):
             "api-key": self.api_key
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.api_url}/openai/deployments/{self.model}/chat/completions?api-version=2023-05-15",
-                headers=headers,
-                json=data
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    self.logger.error(f"Azure OpenAI API error: {response.status} - {error_text}")
-                    raise ValueError(f"Azure OpenAI API error: {response.status} - {error_text}")
-                
-                result = await response.json()
-                
-                # 处理响应
-                return {
-                    "id": result.get("id", ""),
-                    "created": datetime.fromtimestamp(result.get("created", datetime.utcnow().timestamp())).isoformat(),
-                    "content": result.get("choices", [{}])[0].get("message", {}).get("content", ""),
-                    "usage": result.get("usage", {})
-                }
+        session = self._get_session()
+        async with session.post(
+            f"{self.api_url}/openai/deployments/{self.model}/chat/completions?api-version=2023-05-15",
+            headers=headers,
+            json=data
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                self.logger.error(f"Azure OpenAI API error: {response.status} - {error_text}")
+                raise ValueError(f"Azure OpenAI API error: {response.status} - {error_text}")
+            
+            result = await response.json()
+            
+            # 处理响应
+            return {
+                "id": result.get("id", ""),
+                "created": datetime.fromtimestamp(result.get("created", datetime.utcnow().timestamp())).isoformat(),
+                "content": result.get("choices", [{}])[0].get("message", {}).get("content", ""),
+                "usage": result.get("usage", {})
+            }
     
     async def _generate_stream_logic(self, prompt: str, **kwargs) -> AsyncGenerator[Dict[str, Any], None]:
         """流式调用Azure OpenAI API生成响应"""
@@ -412,55 +449,55 @@ class AzureOpenAIClient(OpenAIClient):
             "api-key": self.api_key
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.api_url}/openai/deployments/{self.model}/chat/completions?api-version=2023-05-15",
-                headers=headers,
-                json=data
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    self.logger.error(f"Azure OpenAI API error: {response.status} - {error_text}")
-                    raise ValueError(f"Azure OpenAI API error: {response.status} - {error_text}")
-                
-                # 处理流式响应
-                buffer = ""
-                async for line in response.content.iter_chunked(1024):
-                    line = line.decode('utf-8')
-                    if line.startswith('data: '):
-                        line = line[6:]
-                        if line.strip() == '[DONE]':
-                            break
-                        
-                        try:
-                            chunk_data = json.loads(line)
-                            if chunk_data.get("choices") and len(chunk_data["choices"]) > 0:
-                                delta = chunk_data["choices"][0].get("delta", {})
-                                chunk_content = delta.get("content", "")
+        session = self._get_session()
+        async with session.post(
+            f"{self.api_url}/openai/deployments/{self.model}/chat/completions?api-version=2023-05-15",
+            headers=headers,
+            json=data
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                self.logger.error(f"Azure OpenAI API error: {response.status} - {error_text}")
+                raise ValueError(f"Azure OpenAI API error: {response.status} - {error_text}")
+            
+            # 处理流式响应
+            buffer = ""
+            async for line in response.content.iter_chunked(1024):
+                line = line.decode('utf-8')
+                if line.startswith('data: '):
+                    line = line[6:]
+                    if line.strip() == '[DONE]':
+                        break
+                    
+                    try:
+                        chunk_data = json.loads(line)
+                        if chunk_data.get("choices") and len(chunk_data["choices"]) > 0:
+                            delta = chunk_data["choices"][0].get("delta", {})
+                            chunk_content = delta.get("content", "")
+                            
+                            if chunk_content:
+                                buffer += chunk_content
                                 
-                                if chunk_content:
-                                    buffer += chunk_content
-                                    
-                                    # 当缓冲区达到一定大小时，发送一个块
-                                    if len(buffer) >= self.stream_chunk_size:
-                                        yield {
-                                            "id": chunk_data.get("id", ""),
-                                            "created": datetime.utcnow().isoformat(),
-                                            "content": buffer,
-                                            "is_complete": False
-                                        }
-                                        buffer = ""
-                        except json.JSONDecodeError:
-                            self.logger.warning(f"Failed to parse JSON from stream: {line}")
-                
-                # 发送剩余的缓冲区内容
-                if buffer:
-                    yield {
-                        "id": f"final-{datetime.utcnow().timestamp()}",
-                        "created": datetime.utcnow().isoformat(),
-                        "content": buffer,
-                        "is_complete": True
-                    }
+                                # 当缓冲区达到一定大小时，发送一个块
+                                if len(buffer) >= self.stream_chunk_size:
+                                    yield {
+                                        "id": chunk_data.get("id", ""),
+                                        "created": datetime.utcnow().isoformat(),
+                                        "content": buffer,
+                                        "is_complete": False
+                                    }
+                                    buffer = ""
+                    except json.JSONDecodeError:
+                        self.logger.warning(f"Failed to parse JSON from stream: {line}")
+            
+            # 发送剩余的缓冲区内容
+            if buffer:
+                yield {
+                    "id": f"final-{datetime.utcnow().timestamp()}",
+                    "created": datetime.utcnow().isoformat(),
+                    "content": buffer,
+                    "is_complete": True
+                }
 
 
 def get_llm_client() -> BaseLLMClient:
@@ -67,28 +67,35 @@ class Logger:
             file_handler.setFormatter(formatter)
             root_logger.addHandler(file_handler)
     
-    def debug(self, message: str, **kwargs):
+    def debug(self, message: str, *args, **kwargs):
         """记录调试日志"""
-        self._log(logging.DEBUG, message, **kwargs)
+        self._log(logging.DEBUG, message, *args, **kwargs)
     
-    def info(self, message: str, **kwargs):
+    def info(self, message: str, *args, **kwargs):
         """记录信息日志"""
-        self._log(logging.INFO, message, **kwargs)
+        self._log(logging.INFO, message, *args, **kwargs)
     
-    def warning(self, message: str, **kwargs):
+    def warning(self, message: str, *args, **kwargs):
         """记录警告日志"""
-        self._log(logging.WARNING, message, **kwargs)
+        self._log(logging.WARNING, message, *args, **kwargs)
     
-    def error(self, message: str, **kwargs):
+    def error(self, message: str, *args, **kwargs):
         """记录错误日志"""
-        self._log(logging.ERROR, message, **kwargs)
+        self._log(logging.ERROR, message, *args, **kwargs)
     
-    def critical(self, message: str, **kwargs):
+    def critical(self, message: str, *args, **kwargs):
         """记录严重错误日志"""
-        self._log(logging.CRITICAL, message, **kwargs)
+        self._log(logging.CRITICAL, message, *args, **kwargs)
     
-    def _log(self, level: int, message: str, **kwargs):
-        """记录日志"""
+    def _log(self, level: int, message: str, *args, **kwargs):
+        """记录日志，args用于%格式化（仅在级别启用时执行）"""
+        # 级别未启用时直接返回，避免格式化开销
+        if not self.logger.isEnabledFor(level):
+            return
+        
+        if args:
+            message = message % args
+        
         # 添加时间戳
         kwargs["timestamp"] = datetime.utcnow().isoformat()
         
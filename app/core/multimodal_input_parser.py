@@ -55,6 +55,17 @@ class MultiModalInputParser:
         self.quote_reply_resolver = quote_reply_resolver
         self.system_prompt_parser = system_prompt_parser
         self.integration_manager = integration_manager
+        
+        # 内容类型值 -> 解析方法，解析时一次字典查找完成分派
+        self._handlers = {
+            ContentType.TEXT.value: self.text_parser.parse,
+            ContentType.IMAGE.value: self.image_parser.parse,
+            ContentType.AUDIO.value: self.audio_parser.parse,
+            ContentType.TOOL_OUTPUT.value: self.tool_output_parser.parse,
+            ContentType.PROMPT.value: self.system_prompt_parser.parse,
+            ContentType.MARKDOWN.value: self.text_parser.parse_markdown,
+            ContentType.QUOTE_REPLY.value: self.quote_reply_resolver.parse,
+        }
     
     async def parse(self, message: Message) -> Dict[str, Any]:
         """
@@ -69,24 +80,13 @@ class MultiModalInputParser:
         try:
             content_type = message.content_type
             
-            if content_type == ContentType.TEXT.value:
-                return await self.text_parser.parse(message)
-            elif content_type == ContentType.IMAGE.value:
-                return await self.image_parser.parse(message)
-            elif content_type == ContentType.AUDIO.value:
-                return await self.audio_parser.parse(message)
-            elif content_type == ContentType.TOOL_OUTPUT.value:
-                return await self.tool_output_parser.parse(message)
-            elif content_type == ContentType.PROMPT.value:
-                return await self.system_prompt_parser.parse(message)
-            elif content_type == ContentType.MARKDOWN.value:
-                return await self.text_parser.parse_markdown(message)
-            elif content_type == ContentType.QUOTE_REPLY.value:
-                return await self.quote_reply_resolver.parse(message)
-            else:
+            handler = self._handlers.get(content_type)
+            if handler is None:
                 # 默认作为文本处理
                 self.logger.warning(f"未知内容类型: {content_type}，将作为文本处理")
-                return await self.text_parser.parse(message)
+                handler = self.text_parser.parse
+            
+            return await handler(message)
         
         except Exception as e:
             self.logger.error(f"解析消息失败: {str(e)}")
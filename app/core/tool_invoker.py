@@ -150,6 +150,15 @@ class ToolInvoker:
         """
         return self.tool_registry.list_tools(enabled_only=True)
     
+    def get_available_tools_json(self) -> bytes:
+        """
+        获取可用工具列表（已序列化为JSON）
+        
+        Returns:
+            工具列表的JSON字节串
+        """
+        return self.tool_registry.list_tools_json(enabled_only=True)
+    
     def get_tool_categories(self) -> List[str]:
         """
         获取工具类别
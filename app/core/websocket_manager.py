@@ -91,6 +91,22 @@ class ConnectionManager:
         
         logger.info(f"WebSocket连接已断开: {connection_id}")
     
+    def snapshot_subscribers(self, dialogue_id: str) -> List[WebSocket]:
+        """
+        获取订阅特定对话的所有WebSocket连接快照
+        
+        Args:
+            dialogue_id: 对话ID
+        
+        Returns:
+            WebSocket连接列表
+        """
+        return [
+            websocket
+            for connection_id in self.dialogue_connections.get(dialogue_id, ())
+            for websocket in self.active_connections.get(connection_id, ())
+        ]
+    
     async def send_personal_message(self, message: Any, connection_id: str) -> bool:
         """
         向特定连接发送消息
@@ -159,6 +175,36 @@ class ConnectionManager:
         
         return success
     
+    async def send_bytes_to_subscribers(self, payload: bytes, subscribers: List[WebSocket]) -> bool:
+        """
+        向已获取的连接快照并发发送已序列化的消息
+        
+        Args:
+            payload: 已序列化的JSON字节串，所有连接共用同一份
+            subscribers: WebSocket连接列表（见snapshot_subscribers）
+        
+        Returns:
+            是否成功发送
+        """
+        if not subscribers:
+            return False
+        
+        message = payload.decode()
+        
+        # 各连接互不依赖，同时发送，单个连接失败不影响其他连接
+        results = await asyncio.gather(
+            *(websocket.send_text(message) for websocket in subscribers),
+            return_exceptions=True
+        )
+        
+        success = True
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"发送消息失败: {str(result)}")
+                success = False
+        
+        return success
+    
     async def broadcast(self, message: Any) -> bool:
         """
         广播消息给所有连接
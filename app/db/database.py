@@ -218,6 +218,33 @@ class Database:
             self.logger.error(f"Error deleting {table}:{id}: {str(e)}")
             return False
     
+    async def delete_all(self, table: str) -> bool:
+        """
+        删除表中的所有记录
+        
+        Args:
+            table: 表名
+        
+        Returns:
+            是否删除成功
+        """
+        try:
+            # 如果使用内存存储，直接返回成功
+            if self.db_url == "memory":
+                return True
+            
+            # 确保已连接
+            if not await self.ensure_connected():
+                return False
+            
+            # 删除记录
+            await self.client.delete(table)
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Error deleting all from {table}: {str(e)}")
+            return False
+    
     async def query(self, query: str, params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """
         执行查询
@@ -2,18 +2,107 @@
 数据库存储库
 """
 import logging
-from typing import Dict, Any, List, Optional, Union
+from typing import Dict, Any, List, Optional, Tuple, Union
 from datetime import datetime
+from weakref import WeakKeyDictionary
 
-from .database import db
+from cachetools import TTLCache
+from pydantic import BaseModel
+
+from .database import Database, db
+from ..config import get_config
 from ..models.data_models import Message, Turn, Session, Dialogue
 
 
+class _EntityCache:
+    """
+    轮次/会话/对话的读缓存：(表名, ID) -> 实体
+    update时回写，单条UPDATE语句修改记录时失效；存取均使用副本，避免调用方修改污染缓存
+    """
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self._entities = TTLCache(maxsize=maxsize, ttl=ttl)
+        # 对话ID -> 已缓存的会话ID集合，按对话批量结束会话时据此使缓存失效，无需扫描整个缓存
+        # 每次写入会话缓存时重新赋值以刷新过期时间，保证索引不早于其中的会话过期
+        self._dialogue_sessions = TTLCache(maxsize=maxsize, ttl=ttl)
+    
+    def get(self, table: str, entity_id: str) -> Optional[Any]:
+        """从缓存读取实体副本"""
+        entity = self._entities.get((table, entity_id))
+        return entity.copy(deep=True) if entity is not None else None
+    
+    def put(self, table: str, entity: BaseModel) -> None:
+        """写入实体副本到缓存"""
+        self._entities[(table, entity.id)] = entity.copy(deep=True)
+    
+    def invalidate(self, table: str, entity_id: str) -> None:
+        """使缓存中的实体失效"""
+        self._entities.pop((table, entity_id), None)
+    
+    def put_session(self, session: Session) -> None:
+        """写入会话副本到缓存，并记录其所属对话"""
+        self.put("session", session)
+        session_ids = self._dialogue_sessions.get(session.dialogue_id) or set()
+        session_ids.add(session.id)
+        self._dialogue_sessions[session.dialogue_id] = session_ids
+    
+    def invalidate_dialogue_sessions(self, dialogue_id: str) -> None:
+        """使对话下所有已缓存的会话失效"""
+        for session_id in self._dialogue_sessions.pop(dialogue_id, ()):
+            self.invalidate("session", session_id)
+    
+    def clear(self) -> None:
+        """清空缓存"""
+        self._entities.clear()
+        self._dialogue_sessions.clear()
+
+
+# 数据库实例 -> 读缓存，同一数据库上的存储库共用缓存，不同数据库互不影响
+_entity_caches: "WeakKeyDictionary[Database, _EntityCache]" = WeakKeyDictionary()
+
+
+def _cache_of(database: Database) -> _EntityCache:
+    """获取数据库对应的读缓存，不存在时创建"""
+    cache = _entity_caches.get(database)
+    if cache is None:
+        config = get_config()["database"]
+        cache = _entity_caches[database] = _EntityCache(config["cache_size"], config["cache_ttl"])
+    return cache
+
+
+def clear_entity_cache(database: Database) -> None:
+    """
+    清空数据库对应的读缓存（数据库记录被存储库之外的操作修改时调用）
+    
+    Args:
+        database: 数据库实例
+    """
+    cache = _entity_caches.get(database)
+    if cache is not None:
+        cache.clear()
+
+
+# 未结束会话的条件：Session.dict()写入的end_at为NULL，未赋值的字段为NONE，SurrealDB中二者不相等
+_SESSION_OPEN = "(end_at IS NONE OR end_at IS NULL)"
+
+
+def _message_record(message: Message) -> Dict[str, Any]:
+    """转换为消息记录（非文本消息没有内容预览，不写入该字段）"""
+    return message.dict(exclude={"content_preview"} if message.content_preview is None else None)
+
+
 class MessageRepository:
     """消息存储库"""
     
-    def __init__(self):
+    def __init__(self, database: Optional[Database] = None):
+        """
+        初始化存储库
+        
+        Args:
+            database: 数据库实例，为None时使用全局数据库
+        """
         self.logger = logging.getLogger("MessageRepository")
+        self.db = database if database is not None else db
         self.table = "message"
     
     async def create(self, message: Message) -> Optional[Message]:
@@ -28,10 +117,10 @@ class MessageRepository:
         """
         try:
             # 转换为字典
-            data = message.dict()
+            data = _message_record(message)
             
             # 创建记录
-            result = await db.create(self.table, data)
+            result = await self.db.create(self.table, data)
             
             if result:
                 # 更新ID
@@ -43,6 +132,33 @@ class MessageRepository:
             self.logger.error(f"Error creating message: {str(e)}")
             return None
     
+    async def bulk_create(self, messages: List[Message]) -> List[Message]:
+        """
+        批量创建消息（单条INSERT语句，一次往返）
+        
+        Args:
+            messages: 消息对象列表
+        
+        Returns:
+            创建的消息对象列表
+        """
+        if not messages:
+            return []
+        
+        try:
+            # 创建记录
+            query = f"INSERT INTO {self.table} $data"
+            results = await self.db.query(query, {"data": [_message_record(message) for message in messages]})
+            
+            # 按插入顺序更新ID
+            for message, result in zip(messages, results):
+                message.id = result.get("id", message.id)
+            return messages[:len(results)]
+        
+        except Exception as e:
+            self.logger.error(f"Error bulk creating messages: {str(e)}")
+            return []
+    
     async def get(self, message_id: str) -> Optional[Message]:
         """
         获取消息
@@ -55,7 +171,7 @@ class MessageRepository:
         """
         try:
             # 查询记录
-            results = await db.select(self.table, message_id)
+            results = await self.db.select(self.table, message_id)
             
             if results and len(results) > 0:
                 # 转换为对象
@@ -78,10 +194,10 @@ class MessageRepository:
         """
         try:
             # 转换为字典
-            data = message.dict()
+            data = _message_record(message)
             
             # 更新记录
-            result = await db.update(self.table, message.id, data)
+            result = await self.db.update(self.table, message.id, data)
             
             if result:
                 return message
@@ -103,7 +219,7 @@ class MessageRepository:
         """
         try:
             # 删除记录
-            return await db.delete(self.table, message_id)
+            return await self.db.delete(self.table, message_id)
         
         except Exception as e:
             self.logger.error(f"Error deleting message {message_id}: {str(e)}")
@@ -122,7 +238,7 @@ class MessageRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE turn_id = $turn_id ORDER BY created_at"
-            results = await db.query(query, {"turn_id": turn_id})
+            results = await self.db.query(query, {"turn_id": turn_id})
             
             # 转换为对象
             messages = []
@@ -148,7 +264,7 @@ class MessageRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE session_id = $session_id ORDER BY created_at"
-            results = await db.query(query, {"session_id": session_id})
+            results = await self.db.query(query, {"session_id": session_id})
             
             # 转换为对象
             messages = []
@@ -174,7 +290,7 @@ class MessageRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE dialogue_id = $dialogue_id ORDER BY created_at"
-            results = await db.query(query, {"dialogue_id": dialogue_id})
+            results = await self.db.query(query, {"dialogue_id": dialogue_id})
             
             # 转换为对象
             messages = []
@@ -186,13 +302,116 @@ class MessageRepository:
         except Exception as e:
             self.logger.error(f"Error getting messages for dialogue {dialogue_id}: {str(e)}")
             return []
+    
+    async def get_by_dialogue_recent(
+        self,
+        dialogue_id: str,
+        limit: int,
+        before: Optional[datetime] = None
+    ) -> List[Message]:
+        """
+        获取对话的最近消息（按创建时间倒序）
+        
+        Args:
+            dialogue_id: 对话ID
+            limit: 最大消息数
+            before: 只返回该时间之前的消息，用于向前翻页
+        
+        Returns:
+            消息列表（最新的在前）
+        """
+        try:
+            # 查询记录
+            params = {"dialogue_id": dialogue_id, "limit": limit}
+            condition = "dialogue_id = $dialogue_id"
+            if before:
+                condition += " AND created_at < $before"
+                params["before"] = before
+            query = f"SELECT * FROM {self.table} WHERE {condition} ORDER BY created_at DESC LIMIT $limit"
+            results = await self.db.query(query, params)
+            
+            # 转换为对象
+            return [Message(**result) for result in results]
+        
+        except Exception as e:
+            self.logger.error(f"Error getting recent messages for dialogue {dialogue_id}: {str(e)}")
+            return []
+    
+    async def get_by_session_recent(
+        self,
+        session_id: str,
+        limit: int,
+        before: Optional[datetime] = None
+    ) -> List[Message]:
+        """
+        获取会话的最近消息（按创建时间倒序）
+        
+        Args:
+            session_id: 会话ID
+            limit: 最大消息数
+            before: 只返回该时间之前的消息，用于向前翻页
+        
+        Returns:
+            消息列表（最新的在前）
+        """
+        try:
+            # 查询记录
+            params = {"session_id": session_id, "limit": limit}
+            condition = "session_id = $session_id"
+            if before:
+                condition += " AND created_at < $before"
+                params["before"] = before
+            query = f"SELECT * FROM {self.table} WHERE {condition} ORDER BY created_at DESC LIMIT $limit"
+            results = await self.db.query(query, params)
+            
+            # 转换为对象
+            return [Message(**result) for result in results]
+        
+        except Exception as e:
+            self.logger.error(f"Error getting recent messages for session {session_id}: {str(e)}")
+            return []
+    
+    async def get_by_dialogue_with_turns(
+        self,
+        dialogue_id: str,
+        limit: int,
+        before: Optional[datetime] = None
+    ) -> Tuple[List[Message], Dict[str, Turn]]:
+        """
+        获取对话的最近消息及其所属轮次（两次查询，轮次按ID批量获取）
+        
+        Args:
+            dialogue_id: 对话ID
+            limit: 最大消息数
+            before: 只返回该时间之前的消息，用于向前翻页
+        
+        Returns:
+            (消息列表（最新的在前）, 轮次ID到轮次对象的映射)
+        """
+        messages = await self.get_by_dialogue_recent(dialogue_id, limit, before)
+        if not messages:
+            return messages, {}
+        
+        # 去重后一次性获取所有相关轮次，避免逐条消息查询
+        turn_ids = list(dict.fromkeys(message.turn_id for message in messages))
+        # 与本存储库使用同一数据库（轮次缓存为模块级共享）
+        turns = await TurnRepository(self.db).get_many(turn_ids)
+        
+        return messages, turns
 
 
 class TurnRepository:
     """轮次存储库"""
     
-    def __init__(self):
+    def __init__(self, database: Optional[Database] = None):
+        """
+        初始化存储库
+        
+        Args:
+            database: 数据库实例，为None时使用全局数据库
+        """
         self.logger = logging.getLogger("TurnRepository")
+        self.db = database if database is not None else db
         self.table = "turn"
     
     async def create(self, turn: Turn) -> Optional[Turn]:
@@ -210,11 +429,12 @@ class TurnRepository:
             data = turn.dict()
             
             # 创建记录
-            result = await db.create(self.table, data)
+            result = await self.db.create(self.table, data)
             
             if result:
                 # 更新ID
                 turn.id = result.get("id", turn.id)
+                _cache_of(self.db).put(self.table, turn)
                 return turn
             return None
         
@@ -232,13 +452,20 @@ class TurnRepository:
         Returns:
             轮次对象
         """
+        # 优先读取缓存
+        cached = _cache_of(self.db).get(self.table, turn_id)
+        if cached is not None:
+            return cached
+        
         try:
             # 查询记录
-            results = await db.select(self.table, turn_id)
+            results = await self.db.select(self.table, turn_id)
             
             if results and len(results) > 0:
                 # 转换为对象
-                return Turn(**results[0])
+                turn = Turn(**results[0])
+                _cache_of(self.db).put(self.table, turn)
+                return turn
             return None
         
         except Exception as e:
@@ -260,10 +487,12 @@ class TurnRepository:
             data = turn.dict()
             
             # 更新记录
-            result = await db.update(self.table, turn.id, data)
+            result = await self.db.update(self.table, turn.id, data)
             
             if result:
+                _cache_of(self.db).put(self.table, turn)
                 return turn
+            _cache_of(self.db).invalidate(self.table, turn.id)
             return None
         
         except Exception as e:
@@ -282,12 +511,54 @@ class TurnRepository:
         """
         try:
             # 删除记录
-            return await db.delete(self.table, turn_id)
+            _cache_of(self.db).invalidate(self.table, turn_id)
+            return await self.db.delete(self.table, turn_id)
         
         except Exception as e:
             self.logger.error(f"Error deleting turn {turn_id}: {str(e)}")
             return False
     
+    async def get_many(self, turn_ids: List[str]) -> Dict[str, Turn]:
+        """
+        批量获取轮次（缓存未命中的部分用一条IN查询获取）
+        
+        Args:
+            turn_ids: 轮次ID列表
+        
+        Returns:
+            轮次ID到轮次对象的映射，不存在的ID不包含在内
+        """
+        turns: Dict[str, Turn] = {}
+        missing: List[str] = []
+        
+        # 优先读取缓存
+        for turn_id in turn_ids:
+            cached = _cache_of(self.db).get(self.table, turn_id)
+            if cached is not None:
+                turns[turn_id] = cached
+            else:
+                missing.append(turn_id)
+        
+        if not missing:
+            return turns
+        
+        try:
+            # 查询记录
+            query = f"SELECT * FROM {self.table} WHERE meta::id(id) IN $ids"
+            results = await self.db.query(query, {"ids": missing})
+            
+            # 转换为对象
+            for result in results:
+                turn = Turn(**result)
+                _cache_of(self.db).put(self.table, turn)
+                turns[turn.id] = turn
+            
+            return turns
+        
+        except Exception as e:
+            self.logger.error(f"Error getting turns {missing}: {str(e)}")
+            return turns
+    
     async def get_by_session(self, session_id: str) -> List[Turn]:
         """
         获取会话的所有轮次
@@ -301,7 +572,7 @@ class TurnRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE session_id = $session_id ORDER BY started_at"
-            results = await db.query(query, {"session_id": session_id})
+            results = await self.db.query(query, {"session_id": session_id})
             
             # 转换为对象
             turns = []
@@ -327,7 +598,7 @@ class TurnRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE dialogue_id = $dialogue_id ORDER BY started_at"
-            results = await db.query(query, {"dialogue_id": dialogue_id})
+            results = await self.db.query(query, {"dialogue_id": dialogue_id})
             
             # 转换为对象
             turns = []
@@ -350,7 +621,7 @@ class TurnRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE status = 'unresponded' ORDER BY started_at"
-            results = await db.query(query)
+            results = await self.db.query(query)
             
             # 转换为对象
             turns = []
@@ -362,13 +633,82 @@ class TurnRepository:
         except Exception as e:
             self.logger.error(f"Error getting unresponded turns: {str(e)}")
             return []
+    
+    async def append_message(self, turn_id: str, message_id: str) -> bool:
+        """
+        向轮次追加消息ID（单条UPDATE，无需先读取）
+        
+        Args:
+            turn_id: 轮次ID
+            message_id: 消息ID
+        
+        Returns:
+            是否更新成功
+        """
+        try:
+            query = f"UPDATE type::thing('{self.table}', $id) SET messages += $message_id"
+            await self.db.query(query, {"id": turn_id, "message_id": message_id})
+            _cache_of(self.db).invalidate(self.table, turn_id)
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Error appending message to turn {turn_id}: {str(e)}")
+            return False
+    
+    async def close(
+        self,
+        turn_id: str,
+        status: str,
+        closed_at: datetime,
+        response_time: Optional[float] = None,
+        message_id: Optional[str] = None
+    ) -> bool:
+        """
+        关闭轮次（单条UPDATE，可同时追加响应消息ID）
+        
+        Args:
+            turn_id: 轮次ID
+            status: 轮次状态
+            closed_at: 关闭时间
+            response_time: 响应时间（秒）
+            message_id: 响应消息ID
+        
+        Returns:
+            是否更新成功
+        """
+        try:
+            params = {
+                "id": turn_id,
+                "status": status,
+                "closed_at": closed_at,
+                "response_time": response_time
+            }
+            assignments = "status = $status, closed_at = $closed_at, response_time = $response_time"
+            if message_id:
+                assignments += ", messages += $message_id"
+                params["message_id"] = message_id
+            query = f"UPDATE type::thing('{self.table}', $id) SET {assignments}"
+            await self.db.query(query, params)
+            _cache_of(self.db).invalidate(self.table, turn_id)
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Error closing turn {turn_id}: {str(e)}")
+            return False
 
 
 class SessionRepository:
     """会话存储库"""
     
-    def __init__(self):
+    def __init__(self, database: Optional[Database] = None):
+        """
+        初始化存储库
+        
+        Args:
+            database: 数据库实例，为None时使用全局数据库
+        """
         self.logger = logging.getLogger("SessionRepository")
+        self.db = database if database is not None else db
         self.table = "session"
     
     async def create(self, session: Session) -> Optional[Session]:
@@ -386,11 +726,12 @@ class SessionRepository:
             data = session.dict()
             
             # 创建记录
-            result = await db.create(self.table, data)
+            result = await self.db.create(self.table, data)
             
             if result:
                 # 更新ID
                 session.id = result.get("id", session.id)
+                _cache_of(self.db).put_session(session)
                 return session
             return None
         
@@ -408,13 +749,20 @@ class SessionRepository:
         Returns:
             会话对象
         """
+        # 优先读取缓存
+        cached = _cache_of(self.db).get(self.table, session_id)
+        if cached is not None:
+            return cached
+        
         try:
             # 查询记录
-            results = await db.select(self.table, session_id)
+            results = await self.db.select(self.table, session_id)
             
             if results and len(results) > 0:
                 # 转换为对象
-                return Session(**results[0])
+                session = Session(**results[0])
+                _cache_of(self.db).put_session(session)
+                return session
             return None
         
         except Exception as e:
@@ -436,10 +784,12 @@ class SessionRepository:
             data = session.dict()
             
             # 更新记录
-            result = await db.update(self.table, session.id, data)
+            result = await self.db.update(self.table, session.id, data)
             
             if result:
+                _cache_of(self.db).put_session(session)
                 return session
+            _cache_of(self.db).invalidate(self.table, session.id)
             return None
         
         except Exception as e:
@@ -458,7 +808,8 @@ class SessionRepository:
         """
         try:
             # 删除记录
-            return await db.delete(self.table, session_id)
+            _cache_of(self.db).invalidate(self.table, session_id)
+            return await self.db.delete(self.table, session_id)
         
         except Exception as e:
             self.logger.error(f"Error deleting session {session_id}: {str(e)}")
@@ -477,7 +828,7 @@ class SessionRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE dialogue_id = $dialogue_id ORDER BY start_at"
-            results = await db.query(query, {"dialogue_id": dialogue_id})
+            results = await self.db.query(query, {"dialogue_id": dialogue_id})
             
             # 转换为对象
             sessions = []
@@ -499,8 +850,8 @@ class SessionRepository:
         """
         try:
             # 查询记录
-            query = f"SELECT * FROM {self.table} WHERE end_at IS NULL ORDER BY start_at"
-            results = await db.query(query)
+            query = f"SELECT * FROM {self.table} WHERE {_SESSION_OPEN} ORDER BY start_at"
+            results = await self.db.query(query)
             
             # 转换为对象
             sessions = []
@@ -512,13 +863,64 @@ class SessionRepository:
         except Exception as e:
             self.logger.error(f"Error getting active sessions: {str(e)}")
             return []
+    
+    async def append_turn(self, session_id: str, turn_id: str) -> bool:
+        """
+        向会话追加轮次ID（单条UPDATE，无需先读取）
+        
+        Args:
+            session_id: 会话ID
+            turn_id: 轮次ID
+        
+        Returns:
+            是否更新成功
+        """
+        try:
+            query = f"UPDATE type::thing('{self.table}', $id) SET turns += $turn_id"
+            await self.db.query(query, {"id": session_id, "turn_id": turn_id})
+            _cache_of(self.db).invalidate(self.table, session_id)
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Error appending turn to session {session_id}: {str(e)}")
+            return False
+    
+    async def close_open_sessions(self, dialogue_id: str, ts: datetime) -> bool:
+        """
+        结束对话下所有未结束的会话（单条UPDATE）
+        
+        Args:
+            dialogue_id: 对话ID
+            ts: 结束时间
+        
+        Returns:
+            是否更新成功
+        """
+        try:
+            query = f"UPDATE {self.table} SET end_at = $ts WHERE dialogue_id = $dialogue_id AND {_SESSION_OPEN}"
+            await self.db.query(query, {"dialogue_id": dialogue_id, "ts": ts})
+            
+            # 使该对话下已缓存的会话失效
+            _cache_of(self.db).invalidate_dialogue_sessions(dialogue_id)
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Error closing sessions for dialogue {dialogue_id}: {str(e)}")
+            return False
 
 
 class DialogueRepository:
     """对话存储库"""
     
-    def __init__(self):
+    def __init__(self, database: Optional[Database] = None):
+        """
+        初始化存储库
+        
+        Args:
+            database: 数据库实例，为None时使用全局数据库
+        """
         self.logger = logging.getLogger("DialogueRepository")
+        self.db = database if database is not None else db
         self.table = "dialogue"
     
     async def create(self, dialogue: Dialogue) -> Optional[Dialogue]:
@@ -536,11 +938,12 @@ class DialogueRepository:
             data = dialogue.dict()
             
             # 创建记录
-            result = await db.create(self.table, data)
+            result = await self.db.create(self.table, data)
             
             if result:
                 # 更新ID
                 dialogue.id = result.get("id", dialogue.id)
+                _cache_of(self.db).put(self.table, dialogue)
                 return dialogue
             return None
         
@@ -558,13 +961,20 @@ class DialogueRepository:
         Returns:
             对话对象
         """
+        # 优先读取缓存
+        cached = _cache_of(self.db).get(self.table, dialogue_id)
+        if cached is not None:
+            return cached
+        
         try:
             # 查询记录
-            results = await db.select(self.table, dialogue_id)
+            results = await self.db.select(self.table, dialogue_id)
             
             if results and len(results) > 0:
                 # 转换为对象
-                return Dialogue(**results[0])
+                dialogue = Dialogue(**results[0])
+                _cache_of(self.db).put(self.table, dialogue)
+                return dialogue
             return None
         
         except Exception as e:
@@ -586,10 +996,12 @@ class DialogueRepository:
             data = dialogue.dict()
             
             # 更新记录
-            result = await db.update(self.table, dialogue.id, data)
+            result = await self.db.update(self.table, dialogue.id, data)
             
             if result:
+                _cache_of(self.db).put(self.table, dialogue)
                 return dialogue
+            _cache_of(self.db).invalidate(self.table, dialogue.id)
             return None
         
         except Exception as e:
@@ -608,7 +1020,8 @@ class DialogueRepository:
         """
         try:
             # 删除记录
-            return await db.delete(self.table, dialogue_id)
+            _cache_of(self.db).invalidate(self.table, dialogue_id)
+            return await self.db.delete(self.table, dialogue_id)
         
         except Exception as e:
             self.logger.error(f"Error deleting dialogue {dialogue_id}: {str(e)}")
@@ -627,7 +1040,7 @@ class DialogueRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE human_id = $human_id ORDER BY last_activity_at DESC"
-            results = await db.query(query, {"human_id": human_id})
+            results = await self.db.query(query, {"human_id": human_id})
             
             # 转换为对象
             dialogues = []
@@ -653,7 +1066,7 @@ class DialogueRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE ai_id = $ai_id ORDER BY last_activity_at DESC"
-            results = await db.query(query, {"ai_id": ai_id})
+            results = await self.db.query(query, {"ai_id": ai_id})
             
             # 转换为对象
             dialogues = []
@@ -676,7 +1089,7 @@ class DialogueRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE is_active = true ORDER BY last_activity_at DESC"
-            results = await db.query(query)
+            results = await self.db.query(query)
             
             # 转换为对象
             dialogues = []
@@ -688,13 +1101,104 @@ class DialogueRepository:
         except Exception as e:
             self.logger.error(f"Error getting active dialogues: {str(e)}")
             return []
+    
+    async def get_active(
+        self,
+        human_id: Optional[str] = None,
+        ai_id: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[Dialogue]:
+        """
+        获取活跃对话（过滤条件在查询中执行）
+        
+        Args:
+            human_id: 人类ID
+            ai_id: AI ID
+            limit: 最大返回数量
+        
+        Returns:
+            对话列表
+        """
+        try:
+            # 根据传入参数组合查询条件
+            conditions = ["is_active = true"]
+            params: Dict[str, Any] = {}
+            if human_id:
+                conditions.append("human_id = $human_id")
+                params["human_id"] = human_id
+            if ai_id:
+                conditions.append("ai_id = $ai_id")
+                params["ai_id"] = ai_id
+            
+            query = f"SELECT * FROM {self.table} WHERE {' AND '.join(conditions)} ORDER BY last_activity_at DESC"
+            if limit:
+                query += " LIMIT $limit"
+                params["limit"] = limit
+            results = await self.db.query(query, params)
+            
+            # 转换为对象
+            return [Dialogue(**result) for result in results]
+        
+        except Exception as e:
+            self.logger.error(f"Error getting active dialogues: {str(e)}")
+            return []
+    
+    async def touch_activity(self, dialogue_id: str, ts: datetime) -> bool:
+        """
+        更新对话最后活动时间（单条UPDATE，无需先读取）
+        
+        Args:
+            dialogue_id: 对话ID
+            ts: 活动时间
+        
+        Returns:
+            是否更新成功
+        """
+        try:
+            query = f"UPDATE type::thing('{self.table}', $id) SET last_activity_at = $ts"
+            await self.db.query(query, {"id": dialogue_id, "ts": ts})
+            _cache_of(self.db).invalidate(self.table, dialogue_id)
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Error touching dialogue {dialogue_id}: {str(e)}")
+            return False
+    
+    async def append_session(self, dialogue_id: str, session_id: str, ts: datetime) -> bool:
+        """
+        向对话追加会话ID并更新最后活动时间（单条UPDATE）
+        
+        Args:
+            dialogue_id: 对话ID
+            session_id: 会话ID
+            ts: 活动时间
+        
+        Returns:
+            是否更新成功
+        """
+        try:
+            query = f"UPDATE type::thing('{self.table}', $id) SET sessions += $session_id, last_activity_at = $ts"
+            await self.db.query(query, {"id": dialogue_id, "session_id": session_id, "ts": ts})
+            _cache_of(self.db).invalidate(self.table, dialogue_id)
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Error appending session to dialogue {dialogue_id}: {str(e)}")
+            return False
 
 
 class IntrospectionRepository:
     """自我反思会话存储库"""
     
-    def __init__(self):
+    def __init__(self, database: Optional[Database] = None):
+        """
+        初始化存储库
+        
+        Args:
+            database: 数据库实例，为None时使用全局数据库
+        """
         self.logger = logging.getLogger("IntrospectionRepository")
+        self.db = database if database is not None else db
         self.table = "introspection_session"
     
     async def create(self, session: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -710,14 +1214,14 @@ class IntrospectionRepository:
         try:
             # 确保有ID
             if "id" not in session:
-                session["id"] = f"introspection:{db.generate_id()}"
+                session["id"] = f"introspection:{self.db.generate_id()}"
             
             # 确保有时间戳
             if "started_at" not in session:
                 session["started_at"] = datetime.utcnow()
             
             # 创建记录
-            result = await db.create(self.table, session)
+            result = await self.db.create(self.table, session)
             return result
         
         except Exception as e:
@@ -741,7 +1245,7 @@ class IntrospectionRepository:
                 raise ValueError("会话ID不能为空")
             
             # 更新记录
-            result = await db.update(self.table, session_id, session)
+            result = await self.db.update(self.table, session_id, session)
             return result
         
         except Exception as e:
@@ -760,7 +1264,7 @@ class IntrospectionRepository:
         """
         try:
             # 查询记录
-            results = await db.select(self.table, session_id)
+            results = await self.db.select(self.table, session_id)
             
             if results and len(results) > 0:
                 return results[0]
@@ -811,7 +1315,7 @@ class IntrospectionRepository:
             query_str += f" LIMIT {limit} OFFSET {offset}"
             
             # 执行查询
-            results = await db.query(query_str, query)
+            results = await self.db.query(query_str, query)
             return results
         
         except Exception as e:
@@ -842,7 +1346,7 @@ class IntrospectionRepository:
                     query_str += " WHERE " + " AND ".join(conditions)
             
             # 执行查询
-            results = await db.query(query_str, query)
+            results = await self.db.query(query_str, query)
             
             if results and len(results) > 0:
                 return results[0].get("count", 0)
@@ -864,7 +1368,7 @@ class IntrospectionRepository:
         """
         try:
             # 删除记录
-            return await db.delete(self.table, session_id)
+            return await self.db.delete(self.table, session_id)
         
         except Exception as e:
             self.logger.error(f"Error deleting introspection session {session_id}: {str(e)}")
@@ -874,8 +1378,15 @@ class IntrospectionRepository:
 class ToolCallRepository:
     """工具调用存储库"""
     
-    def __init__(self):
+    def __init__(self, database: Optional[Database] = None):
+        """
+        初始化存储库
+        
+        Args:
+            database: 数据库实例，为None时使用全局数据库
+        """
         self.logger = logging.getLogger("ToolCallRepository")
+        self.db = database if database is not None else db
         self.table = "tool_call"
     
     async def create(self, tool_call: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -891,14 +1402,14 @@ class ToolCallRepository:
         try:
             # 确保有ID
             if "id" not in tool_call:
-                tool_call["id"] = f"tool_call:{db.generate_id()}"
+                tool_call["id"] = f"tool_call:{self.db.generate_id()}"
             
             # 确保有时间戳
             if "created_at" not in tool_call:
                 tool_call["created_at"] = datetime.utcnow()
             
             # 创建记录
-            result = await db.create(self.table, tool_call)
+            result = await self.db.create(self.table, tool_call)
             return result
         
         except Exception as e:
@@ -922,7 +1433,7 @@ class ToolCallRepository:
                 raise ValueError("工具调用ID不能为空")
             
             # 更新记录
-            result = await db.update(self.table, tool_call_id, tool_call)
+            result = await self.db.update(self.table, tool_call_id, tool_call)
             return result
         
         except Exception as e:
@@ -941,7 +1452,7 @@ class ToolCallRepository:
         """
         try:
             # 查询记录
-            results = await db.select(self.table, tool_call_id)
+            results = await self.db.select(self.table, tool_call_id)
             
             if results and len(results) > 0:
                 return results[0]
@@ -964,7 +1475,7 @@ class ToolCallRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE turn_id = $turn_id ORDER BY created_at"
-            results = await db.query(query, {"turn_id": turn_id})
+            results = await self.db.query(query, {"turn_id": turn_id})
             return results
         
         except Exception as e:
@@ -984,7 +1495,7 @@ class ToolCallRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE dialogue_id = $dialogue_id ORDER BY created_at"
-            results = await db.query(query, {"dialogue_id": dialogue_id})
+            results = await self.db.query(query, {"dialogue_id": dialogue_id})
             return results
         
         except Exception as e:
@@ -1004,7 +1515,7 @@ class ToolCallRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE success = false ORDER BY created_at DESC LIMIT {limit}"
-            results = await db.query(query)
+            results = await self.db.query(query)
             return results
         
         except Exception as e:
@@ -1015,8 +1526,15 @@ class ToolCallRepository:
 class EventLogRepository:
     """事件日志存储库"""
     
-    def __init__(self):
+    def __init__(self, database: Optional[Database] = None):
+        """
+        初始化存储库
+        
+        Args:
+            database: 数据库实例，为None时使用全局数据库
+        """
         self.logger = logging.getLogger("EventLogRepository")
+        self.db = database if database is not None else db
         self.table = "event_log"
     
     async def create(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -1032,14 +1550,14 @@ class EventLogRepository:
         try:
             # 确保有ID
             if "id" not in event:
-                event["id"] = f"event:{db.generate_id()}"
+                event["id"] = f"event:{self.db.generate_id()}"
             
             # 确保有时间戳
             if "created_at" not in event:
                 event["created_at"] = datetime.utcnow()
             
             # 创建记录
-            result = await db.create(self.table, event)
+            result = await self.db.create(self.table, event)
             return result
         
         except Exception as e:
@@ -1058,7 +1576,7 @@ class EventLogRepository:
         """
         try:
             # 查询记录
-            results = await db.select(self.table, event_id)
+            results = await self.db.select(self.table, event_id)
             
             if results and len(results) > 0:
                 return results[0]
@@ -1082,7 +1600,7 @@ class EventLogRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE dialogue_id = $dialogue_id ORDER BY created_at DESC LIMIT {limit}"
-            results = await db.query(query, {"dialogue_id": dialogue_id})
+            results = await self.db.query(query, {"dialogue_id": dialogue_id})
             return results
         
         except Exception as e:
@@ -1103,7 +1621,7 @@ class EventLogRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE event_type = $event_type ORDER BY created_at DESC LIMIT {limit}"
-            results = await db.query(query, {"event_type": event_type})
+            results = await self.db.query(query, {"event_type": event_type})
             return results
         
         except Exception as e:
@@ -1123,7 +1641,7 @@ class EventLogRepository:
         try:
             # 查询记录
             query = f"SELECT * FROM {self.table} WHERE event_type LIKE 'error%' ORDER BY created_at DESC LIMIT {limit}"
-            results = await db.query(query)
+            results = await self.db.query(query)
             return results
         
         except Exception as e:
@@ -8,6 +8,7 @@ import os
 from typing import Dict, Any, List, Optional
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 
@@ -58,6 +59,8 @@ dialogue_core = DialogueCore()
 from .db.database import db
 from .db.repositories import message_repo, turn_repo, session_repo, dialogue_repo
 from .services.dialogue_service import dialogue_service
+from .tools.tool_registry import tool_registry
+from .core.llm_clients import close_shared_session
 
 # 导入API路由
 from .api import sessions, turns, messages, tools, realtime, media, introspection, multi_agent, knowledge_base
@@ -533,10 +536,10 @@ async def list_tools():
         # 创建工具调用器
         tool_invoker = ToolInvoker()
         
-        # 获取工具列表
-        tools = tool_invoker.get_available_tools()
+        # 获取工具列表（使用缓存的JSON，避免每次请求重新构建和序列化）
+        tools = tool_invoker.get_available_tools_json()
         
-        return {"tools": tools}
+        return Response(content=b'{"tools":' + tools + b'}', media_type="application/json")
     
     except Exception as e:
         logger.error(f"Error listing tools: {str(e)}")
@@ -670,6 +673,15 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用程序关闭事件"""
+    # 等待后台写入完成
+    await dialogue_service.shutdown()
+    
+    # 关闭工具持有的HTTP连接池
+    await tool_registry.close()
+    
+    # 关闭LLM客户端共享的HTTP会话
+    await close_shared_session()
+    
     # 断开数据库连接
     await db.disconnect()
     logger.info("Database disconnected")
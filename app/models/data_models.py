@@ -3,7 +3,7 @@
 基于彩虹城AI对话管理系统四层数据结构
 """
 from typing import Optional, List, Dict, Any, Union
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 from datetime import datetime
 import uuid
 
@@ -28,6 +28,17 @@ class Message(BaseModel):
     content_type: str  # 'text' | 'image' | 'audio' | 'tool_output' | 'prompt' | ...
     created_at: datetime = Field(default_factory=datetime.utcnow)
     metadata: Optional[Dict[str, Any]] = Field(default_factory=dict)
+    content_preview: Optional[str] = None  # 文本内容预览，创建时计算一次，供通知直接使用
+
+    @validator('content_preview', pre=True, always=True)
+    def compute_content_preview(cls, v, values):
+        # 从数据库读取的文本消息已带有预览，只在创建消息（字段缺省）时计算一次
+        if v is not None:
+            return v
+        if values.get('content_type') != 'text':
+            return None
+        content = values.get('content') or ""
+        return content[:100] + "..." if len(content) > 100 else content
 
     class Config:
         schema_extra = {
@@ -45,7 +56,8 @@ class Message(BaseModel):
                     "emotion": "calm",
                     "intent": "inform",
                     "tool_used": None
-                }
+                },
+                "content_preview": "明天新加坡38度，不需要带伞。"
             }
         }
 
@@ -2,17 +2,61 @@
 对话服务模块
 提供对话相关的高级服务
 """
+from __future__ import annotations
+
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional, Union
+import time
+from functools import cached_property
+from typing import Any, Optional
 from datetime import datetime
-import json
 
+from cachetools import TTLCache
+
+from ..config import get_config
+from ..core.constants import DialogueTypes
 from ..db.repositories import message_repo, turn_repo, session_repo, dialogue_repo
 from ..models.data_models import Message, Turn, Session, Dialogue
 # 避免循环导入
 # from ..core.dialogue_core import DialogueCore
 from ..core.websocket_manager import websocket_manager
-from .notification_service import notification_service
+from .notification_service import notification_service, StreamCoalescer
+
+_utcnow = datetime.utcnow
+
+# 轮次单调时钟起点的保留时间（秒）和最大记录数，超时或被淘汰的轮次回退为按started_at计算响应时间
+_TURN_CLOCK_TTL = 3600
+_TURN_CLOCK_SIZE = 10000
+
+# 后台通知任务（持有引用，避免任务被垃圾回收）
+_bg: set[asyncio.Task] = set()
+
+
+def _fire_and_forget(coro) -> asyncio.Task:
+    """
+    在后台发送非关键通知，不阻塞调用方（通知方法自身已捕获并记录异常）
+    
+    Args:
+        coro: 通知协程
+    
+    Returns:
+        后台任务
+    """
+    task = asyncio.create_task(coro)
+    _bg.add(task)
+    task.add_done_callback(_bg.discard)
+    return task
+
+# 各对话类型的参数要求：(必需参数, ((元数据键, 最少成员数), ...))，成员数为0表示只要求存在
+_TYPE_RULES: dict[str, tuple[tuple[str, ...], tuple[tuple[str, int], ...]]] = {
+    DialogueTypes.HUMAN_AI: (("human_id", "ai_id"), ()),                                      # 人类 ⇄ AI 私聊
+    DialogueTypes.AI_SELF: (("ai_id",), ()),                                                  # AI ⇄ 自我（自省/觉知）
+    DialogueTypes.AI_AI: (("ai_id",), (("participant_ai_ids", 0),)),                          # AI ⇄ AI 对话
+    DialogueTypes.HUMAN_HUMAN_PRIVATE: (("human_id",), (("second_human_id", 0),)),            # 人类 ⇄ 人类 私聊
+    DialogueTypes.HUMAN_HUMAN_GROUP: ((), (("group_members", 2),)),                           # 人类 ⇄ 人类 群聊
+    DialogueTypes.HUMAN_AI_GROUP: ((), (("human_members", 1), ("ai_members", 1))),            # 人类 ⇄ AI 群组 (LIO)
+    DialogueTypes.AI_MULTI_HUMAN: (("ai_id",), (("human_participants", 1),)),                 # AI ⇄ 多人类 群组
+}
 
 
 class DialogueService:
@@ -20,9 +64,146 @@ class DialogueService:
     
     def __init__(self):
         self.logger = logging.getLogger("DialogueService")
-        # 不在初始化时创建dialogue_core实例，而是在需要时才创建
-        self.dialogue_core = None
+        # 后台写入任务（持有引用，避免任务被垃圾回收）
+        self._pending_writes: set[asyncio.Task] = set()
+        # 单个请求的数据库并发上限，避免一个请求占满连接池
+        self._db_concurrency = get_config()["database"]["sem_per_request"]
+        # 轮次ID -> 创建时的单调时钟读数，用于计算响应时间
+        self._turn_mono_start: TTLCache = TTLCache(maxsize=_TURN_CLOCK_SIZE, ttl=_TURN_CLOCK_TTL)
+    
+    @cached_property
+    def dialogue_core(self):
+        """
+        对话核心（首次访问时创建，之后直接从实例字典读取）
+        
+        Returns:
+            DialogueCore实例
+        """
+        # 延迟导入，避免循环导入
+        from ..core.dialogue_core import DialogueCore
+        return DialogueCore()
+    
+    def _spawn_write(self, coro) -> asyncio.Task:
+        """
+        在后台执行数据库写入，不阻塞调用方
+        
+        Args:
+            coro: 写入协程
+        
+        Returns:
+            后台任务
+        """
+        task = asyncio.create_task(coro)
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+        return task
+    
+    async def _persist_message(self, message: Message) -> bool:
+        """
+        持久化消息，失败时记录日志
+        
+        Args:
+            message: 消息对象
         
+        Returns:
+            是否保存成功
+        """
+        try:
+            if await message_repo.create(message):
+                return True
+            self.logger.error("Failed to persist message: %s", message.id)
+        except Exception as e:
+            self.logger.error("Error persisting message %s: %s", message.id, e)
+        return False
+    
+    async def _notify_processed(
+        self,
+        persist: asyncio.Task,
+        message: Message,
+        dialogue: Optional[Dialogue],
+        subscribers: list
+    ) -> None:
+        """
+        响应消息写库完成后，按顺序发送新消息、对话更新和处理完成通知
+        
+        Args:
+            persist: 响应消息的写库任务
+            message: 响应消息
+            dialogue: 对话对象（不存在时不发送对话更新通知）
+            subscribers: 对话的WebSocket连接快照
+        """
+        # 等待写库完成，保证客户端收到的消息ID已可查询
+        if not await persist:
+            await notification_service.send_error_notification(
+                message.dialogue_id, "响应消息保存失败", subscribers=subscribers
+            )
+            return
+        
+        await notification_service.send_message_notification(message, subscribers=subscribers)
+        if dialogue:
+            await notification_service.send_dialogue_update_notification(
+                dialogue, "message_processed", subscribers=subscribers
+            )
+        await notification_service.send_processing_complete_notification(
+            message_id=message.id,
+            dialogue_id=message.dialogue_id,
+            subscribers=subscribers
+        )
+    
+    async def _close_turn(
+        self,
+        persist: asyncio.Task,
+        sem: asyncio.Semaphore,
+        turn_id: str,
+        closed_at: datetime,
+        response_time: float,
+        message_id: str
+    ) -> bool:
+        """
+        响应消息写库成功后关闭轮次并记录响应消息ID（写库失败时轮次保持打开，不指向不存在的消息）
+        
+        Args:
+            persist: 响应消息的写库任务
+            sem: 请求级信号量
+            turn_id: 轮次ID
+            closed_at: 关闭时间
+            response_time: 响应时间（秒）
+            message_id: 响应消息ID
+        
+        Returns:
+            是否关闭成功
+        """
+        if not await persist:
+            return False
+        return await self._bounded(sem, turn_repo.close(
+            turn_id,
+            status="responded",
+            closed_at=closed_at,
+            response_time=response_time,
+            message_id=message_id
+        ))
+    
+    @staticmethod
+    async def _bounded(sem: asyncio.Semaphore, coro):
+        """
+        在请求级信号量限制下执行数据库操作
+        
+        Args:
+            sem: 请求级信号量
+            coro: 数据库操作协程
+        
+        Returns:
+            操作结果
+        """
+        async with sem:
+            return await coro
+    
+    async def shutdown(self) -> None:
+        """等待所有后台写入和通知完成"""
+        pending = self._pending_writes | _bg
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    
     async def create_dialogue_with_type(
         self,
         dialogue_type: str,
@@ -30,7 +211,7 @@ class DialogueService:
         ai_id: Optional[str] = None,
         title: Optional[str] = None,
         description: Optional[str] = None,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[dict[str, Any]] = None
     ) -> Optional[Dialogue]:
         """
         创建指定类型的对话，并验证必要参数
@@ -46,58 +227,24 @@ class DialogueService:
         Returns:
             创建的对话对象
         """
-        from ..core.constants import DialogueTypes
-        
-        # 验证对话类型
-        if dialogue_type not in DialogueTypes.ALL:
-            self.logger.error(f"Invalid dialogue type: {dialogue_type}")
+        # 验证对话类型（规则表即合法类型集合）
+        rule = _TYPE_RULES.get(dialogue_type)
+        if rule is None:
+            self.logger.error("Invalid dialogue type: %s", dialogue_type)
             return None
         
-        # 根据对话类型验证必要参数
-        if dialogue_type == DialogueTypes.HUMAN_AI:
-            # 人类 ⇄ AI 私聊
-            if not human_id or not ai_id:
-                self.logger.error(f"human_id and ai_id are required for dialogue type: {dialogue_type}")
-                return None
-        
-        elif dialogue_type == DialogueTypes.AI_SELF:
-            # AI ⇄ 自我（自省/觉知）
-            if not ai_id:
-                self.logger.error(f"ai_id is required for dialogue type: {dialogue_type}")
-                return None
-        
-        elif dialogue_type == DialogueTypes.AI_AI:
-            # AI ⇄ AI 对话
-            if not ai_id or not metadata or "participant_ai_ids" not in metadata:
-                self.logger.error(f"ai_id and participant_ai_ids are required for dialogue type: {dialogue_type}")
-                return None
-        
-        elif dialogue_type == DialogueTypes.HUMAN_HUMAN_PRIVATE:
-            # 人类 ⇄ 人类 私聊
-            if not human_id or not metadata or "second_human_id" not in metadata:
-                self.logger.error(f"human_id and second_human_id are required for dialogue type: {dialogue_type}")
-                return None
-        
-        elif dialogue_type == DialogueTypes.HUMAN_HUMAN_GROUP:
-            # 人类 ⇄ 人类 群聊
-            if not metadata or "group_members" not in metadata or len(metadata["group_members"]) < 2:
-                self.logger.error(f"At least two group_members are required for dialogue type: {dialogue_type}")
-                return None
-        
-        elif dialogue_type == DialogueTypes.HUMAN_AI_GROUP:
-            # 人类 ⇄ AI 群组 (LIO)
-            if not metadata or "human_members" not in metadata or "ai_members" not in metadata:
-                self.logger.error(f"human_members and ai_members are required for dialogue type: {dialogue_type}")
-                return None
-            if len(metadata["human_members"]) < 1 or len(metadata["ai_members"]) < 1:
-                self.logger.error(f"At least one human and one AI member are required for dialogue type: {dialogue_type}")
-                return None
-        
-        elif dialogue_type == DialogueTypes.AI_MULTI_HUMAN:
-            # AI ⇄ 多人类 群组
-            if not ai_id or not metadata or "human_participants" not in metadata or len(metadata["human_participants"]) < 1:
-                self.logger.error(f"ai_id and at least one human_participant are required for dialogue type: {dialogue_type}")
-                return None
+        # 根据对话类型规则验证必要参数
+        required_args, required_meta = rule
+        args = {"human_id": human_id, "ai_id": ai_id}
+        meta = metadata or {}
+        missing = [name for name in required_args if not args[name]]
+        missing.extend(
+            key for key, min_count in required_meta
+            if key not in meta or (min_count and len(meta[key]) < min_count)
+        )
+        if missing:
+            self.logger.error("Missing or insufficient %s for dialogue type: %s", ', '.join(missing), dialogue_type)
+            return None
         
         # 创建对话
         return await self.create_dialogue(
@@ -116,7 +263,7 @@ class DialogueService:
         ai_id: Optional[str] = None,
         title: Optional[str] = None,
         description: Optional[str] = None,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[dict[str, Any]] = None
     ) -> Optional[Dialogue]:
         """
         创建对话
@@ -147,7 +294,7 @@ class DialogueService:
             return await dialogue_repo.create(dialogue)
         
         except Exception as e:
-            self.logger.error(f"Error creating dialogue: {str(e)}")
+            self.logger.error("Error creating dialogue: %s", e)
             return None
     
     async def create_session(
@@ -156,7 +303,7 @@ class DialogueService:
         session_type: str,
         created_by: str,
         description: Optional[str] = None,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[dict[str, Any]] = None
     ) -> Optional[Session]:
         """
         创建会话
@@ -186,16 +333,12 @@ class DialogueService:
             
             if created_session:
                 # 更新对话
-                dialogue = await dialogue_repo.get(dialogue_id)
-                if dialogue:
-                    dialogue.sessions.append(created_session.id)
-                    dialogue.last_activity_at = datetime.utcnow()
-                    await dialogue_repo.update(dialogue)
+                await dialogue_repo.append_session(dialogue_id, created_session.id, _utcnow())
             
             return created_session
         
         except Exception as e:
-            self.logger.error(f"Error creating session: {str(e)}")
+            self.logger.error("Error creating session: %s", e)
             return None
     
     async def create_turn(
@@ -204,7 +347,7 @@ class DialogueService:
         session_id: str,
         initiator_role: str,
         responder_role: str,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[dict[str, Any]] = None
     ) -> Optional[Turn]:
         """
         创建轮次
@@ -229,26 +372,24 @@ class DialogueService:
                 metadata=metadata or {}
             )
             
+            # 记录单调时钟起点，响应时间不依赖datetime相减
+            mono_start = time.monotonic()
+            
             # 保存到数据库
             created_turn = await turn_repo.create(turn)
             
             if created_turn:
-                # 更新会话
-                session = await session_repo.get(session_id)
-                if session:
-                    session.turns.append(created_turn.id)
-                    await session_repo.update(session)
-                
-                # 更新对话
-                dialogue = await dialogue_repo.get(dialogue_id)
-                if dialogue:
-                    dialogue.last_activity_at = datetime.utcnow()
-                    await dialogue_repo.update(dialogue)
+                self._turn_mono_start[created_turn.id] = mono_start
+                # 更新会话和对话
+                await asyncio.gather(
+                    session_repo.append_turn(session_id, created_turn.id),
+                    dialogue_repo.touch_activity(dialogue_id, _utcnow())
+                )
             
             return created_turn
         
         except Exception as e:
-            self.logger.error(f"Error creating turn: {str(e)}")
+            self.logger.error("Error creating turn: %s", e)
             return None
     
     async def create_message(
@@ -260,7 +401,7 @@ class DialogueService:
         sender_id: str,
         content: str,
         content_type: str,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[dict[str, Any]] = None
     ) -> Optional[Message]:
         """
         创建消息
@@ -295,29 +436,23 @@ class DialogueService:
             created_message = await message_repo.create(message)
             
             if created_message:
-                # 更新轮次
-                turn = await turn_repo.get(turn_id)
-                if turn:
-                    turn.messages.append(created_message.id)
-                    await turn_repo.update(turn)
-                
-                # 更新对话
-                dialogue = await dialogue_repo.get(dialogue_id)
-                if dialogue:
-                    dialogue.last_activity_at = datetime.utcnow()
-                    await dialogue_repo.update(dialogue)
+                # 更新轮次和对话
+                await asyncio.gather(
+                    turn_repo.append_message(turn_id, created_message.id),
+                    dialogue_repo.touch_activity(dialogue_id, _utcnow())
+                )
             
             return created_message
         
         except Exception as e:
-            self.logger.error(f"Error creating message: {str(e)}")
+            self.logger.error("Error creating message: %s", e)
             return None
     
     async def process_message(
         self,
         message: Message,
         stream: bool = True
-    ) -> Dict[str, Any]:
+    ) -> dict[str, Any]:
         """
         处理消息
         
@@ -329,11 +464,14 @@ class DialogueService:
             处理结果
         """
         try:
-            # 获取对话历史
-            history = await self.get_dialogue_history(message.dialogue_id)
+            # 本请求内的数据库操作共享同一并发额度
+            db_sem = asyncio.Semaphore(self._db_concurrency)
             
-            # 发送消息处理开始通知
-            await notification_service.send_processing_notification(message)
+            # 获取对话历史，同时发送消息处理开始通知
+            history, _ = await asyncio.gather(
+                self._bounded(db_sem, self.get_dialogue_history(message.dialogue_id)),
+                notification_service.send_processing_notification(message)
+            )
             
             # 定义流式响应回调函数
             async def stream_callback(content: str, is_complete: bool):
@@ -345,17 +483,12 @@ class DialogueService:
                     is_complete=is_complete
                 )
             
-            # 延迟导入和实例化DialogueCore，避免循环导入
-            if self.dialogue_core is None:
-                from ..core.dialogue_core import DialogueCore
-                self.dialogue_core = DialogueCore()
-                
-            # 使用对话核心处理消息（流式响应）
+            # 使用对话核心处理消息（流式响应，按时间窗口合并推送）
             if stream:
                 result = await self.dialogue_core.process_message(
                     message=message, 
                     history=history,
-                    stream_callback=stream_callback
+                    stream_callback=StreamCoalescer(stream_callback).push
                 )
             else:
                 # 不使用流式响应
@@ -364,8 +497,11 @@ class DialogueService:
                     history=history
                 )
             
-            # 创建响应消息
-            response_message = await self.create_message(
+            # 生成结束后的通知共用同一份订阅者快照（生成可能耗时较长，不能在生成前获取）
+            subscribers = websocket_manager.snapshot_subscribers(message.dialogue_id)
+            
+            # 创建响应消息（ID在本地生成，写库放到后台执行）
+            response_message = Message(
                 dialogue_id=message.dialogue_id,
                 session_id=message.session_id,
                 turn_id=message.turn_id,
@@ -375,42 +511,59 @@ class DialogueService:
                 content_type=result.get("content_type", "text"),
                 metadata=result.get("metadata", {})
             )
+            persist = self._spawn_write(self._persist_message(response_message))
             
-            # 更新轮次状态
-            turn = await turn_repo.get(message.turn_id)
+            # 轮次关闭与对话活动使用同一时间戳
+            now = _utcnow()
+            
+            # 并发获取轮次（计算响应时间）和对话（更新通知）
+            turn, dialogue = await asyncio.gather(
+                self._bounded(db_sem, turn_repo.get(message.turn_id)),
+                self._bounded(db_sem, dialogue_repo.get(message.dialogue_id))
+            )
+            
+            # 轮次关闭（等待响应消息写库成功）与对话更新互不依赖，一并执行
+            pending = []
+            
+            # 更新轮次状态（closed_at仅用于审计，响应时间优先按单调时钟计算）
+            mono_start = self._turn_mono_start.pop(message.turn_id, None)
             if turn:
-                turn.status = "responded"
-                turn.closed_at = datetime.utcnow()
-                turn.response_time = (turn.closed_at - turn.started_at).total_seconds()
-                await turn_repo.update(turn)
+                if mono_start is not None:
+                    response_time = time.monotonic() - mono_start
+                else:
+                    # 轮次由其他进程创建或起点已过期
+                    response_time = (now - turn.started_at).total_seconds()
+                pending.append(self._close_turn(
+                    persist,
+                    db_sem,
+                    message.turn_id,
+                    closed_at=now,
+                    response_time=response_time,
+                    message_id=response_message.id
+                ))
             
-            # 更新对话最后活动时间
-            dialogue = await dialogue_repo.get(message.dialogue_id)
+            # 更新对话最后活动时间（本请求唯一一次）
             if dialogue:
-                dialogue.last_activity_at = datetime.utcnow()
-                await dialogue_repo.update(dialogue)
-                
-                # 发送对话更新通知
-                await notification_service.send_dialogue_update_notification(dialogue, "message_processed")
-            
-            # 发送消息完成通知
-            if response_message:
-                await notification_service.send_message_notification(response_message)
-                await notification_service.send_processing_complete_notification(
-                    message_id=response_message.id,
-                    dialogue_id=message.dialogue_id
-                )
+                dialogue.last_activity_at = now
+                pending.append(self._bounded(db_sem, dialogue_repo.touch_activity(message.dialogue_id, now)))
+            
+            # 响应消息写库后在同一后台任务中按顺序发送通知（返回结果不依赖通知送达）
+            _fire_and_forget(self._notify_processed(persist, response_message, dialogue, subscribers))
+            
+            for outcome in await asyncio.gather(*pending, return_exceptions=True):
+                if isinstance(outcome, Exception):
+                    self.logger.error("Error finalizing message %s: %s", response_message.id, outcome)
             
             return {
                 "success": True,
-                "message_id": response_message.id if response_message else None,
+                "message_id": response_message.id,
                 "content": result.get("content", ""),
                 "content_type": result.get("content_type", "text"),
                 "metadata": result.get("metadata", {})
             }
         
         except Exception as e:
-            self.logger.error(f"Error processing message: {str(e)}")
+            self.logger.error("Error processing message: %s", e)
             # 发送错误通知
             await notification_service.send_error_notification(message.dialogue_id, str(e))
             return {
@@ -422,7 +575,7 @@ class DialogueService:
         self,
         dialogue_id: str,
         max_messages: int = 50
-    ) -> List[Message]:
+    ) -> list[Message]:
         """
         获取对话历史
         
@@ -434,53 +587,85 @@ class DialogueService:
             消息列表
         """
         try:
-            # 获取对话的所有消息
-            messages = await message_repo.get_by_dialogue(dialogue_id)
-            
-            # 按创建时间排序
-            messages.sort(key=lambda m: m.created_at)
+            # 只取最近的消息（数据库倒序+LIMIT）
+            messages = await message_repo.get_by_dialogue_recent(dialogue_id, max_messages)
             
-            # 限制消息数量
-            if len(messages) > max_messages:
-                messages = messages[-max_messages:]
+            # 恢复为按创建时间正序
+            messages.reverse()
             
             return messages
         
         except Exception as e:
-            self.logger.error(f"Error getting dialogue history: {str(e)}")
+            self.logger.error("Error getting dialogue history: %s", e)
             return []
     
+    async def get_dialogue_history_with_turns(
+        self,
+        dialogue_id: str,
+        max_messages: int = 50
+    ) -> tuple[list[Message], dict[str, Turn]]:
+        """
+        获取对话历史及消息所属的轮次，供需要轮次元数据的提示词构建使用
+        
+        Args:
+            dialogue_id: 对话ID
+            max_messages: 最大消息数
+        
+        Returns:
+            (消息列表, 轮次ID到轮次对象的映射)
+        """
+        try:
+            # 消息和轮次共两次查询，轮次通过IN批量获取
+            messages, turns = await message_repo.get_by_dialogue_with_turns(dialogue_id, max_messages)
+            
+            # 恢复为按创建时间正序
+            messages.reverse()
+            
+            return messages, turns
+        
+        except Exception as e:
+            self.logger.error("Error getting dialogue history with turns: %s", e)
+            return [], {}
+    
     async def get_session_history(
         self,
-        session_id: str
-    ) -> List[Message]:
+        session_id: str,
+        max_messages: Optional[int] = None,
+        before: Optional[datetime] = None
+    ) -> list[Message]:
         """
         获取会话历史
         
         Args:
             session_id: 会话ID
+            max_messages: 最大消息数，为None时返回全部消息
+            before: 只返回该时间之前的消息，用于向前翻页
         
         Returns:
             消息列表
         """
         try:
-            # 获取会话的所有消息
-            messages = await message_repo.get_by_session(session_id)
+            if max_messages is None and before is None:
+                # 获取会话的所有消息（已按创建时间排序）
+                return await message_repo.get_by_session(session_id)
             
-            # 按创建时间排序
-            messages.sort(key=lambda m: m.created_at)
+            # 分页获取最近的消息，并恢复为正序
+            messages = await message_repo.get_by_session_recent(
+                session_id, max_messages or 50, before=before
+            )
+            messages.reverse()
             
             return messages
         
         except Exception as e:
-            self.logger.error(f"Error getting session history: {str(e)}")
+            self.logger.error("Error getting session history: %s", e)
             return []
     
     async def get_active_dialogues(
         self,
         human_id: Optional[str] = None,
         ai_id: Optional[str] = None
-    ) -> List[Dialogue]:
+    ) -> list[Dialogue]:
         """
         获取活跃对话
         
@@ -492,19 +677,11 @@ class DialogueService:
             对话列表
         """
         try:
-            # 获取活跃对话
-            dialogues = await dialogue_repo.get_active_dialogues()
-            
-            # 过滤
-            if human_id:
-                dialogues = [d for d in dialogues if d.human_id == human_id]
-            if ai_id:
-                dialogues = [d for d in dialogues if d.ai_id == ai_id]
-            
-            return dialogues
+            # 获取活跃对话（过滤在数据库中完成）
+            return await dialogue_repo.get_active(human_id=human_id, ai_id=ai_id)
         
         except Exception as e:
-            self.logger.error(f"Error getting active dialogues: {str(e)}")
+            self.logger.error("Error getting active dialogues: %s", e)
             return []
     
     async def close_session(
@@ -527,13 +704,13 @@ class DialogueService:
                 return False
             
             # 关闭会话
-            session.end_at = datetime.utcnow()
+            session.end_at = _utcnow()
             await session_repo.update(session)
             
             return True
         
         except Exception as e:
-            self.logger.error(f"Error closing session: {str(e)}")
+            self.logger.error("Error closing session: %s", e)
             return False
     
     async def close_dialogue(
@@ -555,21 +732,17 @@ class DialogueService:
             if not dialogue:
                 return False
             
-            # 关闭对话
+            # 关闭对话，同时结束所有未结束的会话
             dialogue.is_active = False
-            await dialogue_repo.update(dialogue)
-            
-            # 关闭所有会话
-            sessions = await session_repo.get_by_dialogue(dialogue_id)
-            for session in sessions:
-                if not session.end_at:
-                    session.end_at = datetime.utcnow()
-                    await session_repo.update(session)
+            await asyncio.gather(
+                dialogue_repo.update(dialogue),
+                session_repo.close_open_sessions(dialogue_id, _utcnow())
+            )
             
             return True
         
         except Exception as e:
-            self.logger.error(f"Error closing dialogue: {str(e)}")
+            self.logger.error("Error closing dialogue: %s", e)
             return False
 
 
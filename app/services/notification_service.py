@@ -2,202 +2,356 @@
 通知服务模块
 提供实时通知和事件推送功能
 """
-import json
-from typing import Dict, Any, Optional, List
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Set, Callable, Awaitable
 from datetime import datetime
 
+import orjson
+from fastapi import WebSocket
+
 from ..core.websocket_manager import websocket_manager
 from ..core.logger import logger
 from ..models.data_models import Message, Turn, Session, Dialogue
 
+# 时间戳缓存：[单调时钟纳秒, UTC时间]，流式响应等高频通知在1毫秒内复用同一时间戳
+_clock_cache: List[Any] = [0, None]
+
+
+def _utc_now() -> datetime:
+    """获取当前UTC时间（1毫秒内复用缓存值）"""
+    now_ns = time.monotonic_ns()
+    if now_ns - _clock_cache[0] > 1_000_000:
+        _clock_cache[0] = now_ns
+        _clock_cache[1] = datetime.utcnow()
+    return _clock_cache[1]
+
+
+# 通知结构：固定字段的frozen dataclass，orjson可直接序列化，__slots__避免每个实例分配__dict__
+@dataclass(frozen=True)
+class NewMessageNotification:
+    """新消息通知"""
+    __slots__ = (
+        "type", "message_id", "dialogue_id", "session_id", "turn_id",
+        "sender_role", "sender_id", "content_type", "created_at", "content_preview"
+    )
+    type: str
+    message_id: str
+    dialogue_id: str
+    session_id: str
+    turn_id: str
+    sender_role: str
+    sender_id: Optional[str]
+    content_type: str
+    created_at: datetime
+    content_preview: Optional[str]
+
+
+@dataclass(frozen=True)
+class ProcessingNotification:
+    """消息处理开始通知"""
+    __slots__ = ("type", "message_id", "dialogue_id", "session_id", "turn_id", "timestamp")
+    type: str
+    message_id: str
+    dialogue_id: str
+    session_id: str
+    turn_id: str
+    timestamp: datetime
+
+
+@dataclass(frozen=True)
+class ProcessingCompleteNotification:
+    """消息处理完成通知"""
+    __slots__ = ("type", "message_id", "dialogue_id", "timestamp")
+    type: str
+    message_id: str
+    dialogue_id: str
+    timestamp: datetime
+
+
+@dataclass(frozen=True)
+class ErrorNotification:
+    """错误通知"""
+    __slots__ = ("type", "dialogue_id", "error", "timestamp")
+    type: str
+    dialogue_id: str
+    error: str
+    timestamp: datetime
+
+
+@dataclass(frozen=True)
+class DialogueUpdateNotification:
+    """对话更新通知"""
+    __slots__ = ("type", "dialogue_id", "update_type", "is_active", "last_activity_at", "timestamp")
+    type: str
+    dialogue_id: str
+    update_type: str
+    is_active: bool
+    last_activity_at: datetime
+    timestamp: datetime
+
+
+@dataclass(frozen=True)
+class StreamNotification:
+    """流式响应通知"""
+    __slots__ = ("type", "dialogue_id", "session_id", "turn_id", "content", "is_complete", "timestamp")
+    type: str
+    dialogue_id: str
+    session_id: str
+    turn_id: str
+    content: str
+    is_complete: bool
+    timestamp: datetime
+
 
 class NotificationService:
     """通知服务"""
     
-    async def send_message_notification(self, message: Message) -> bool:
+    __slots__ = ()
+    
+    async def send_message_notification(self, message: Message, subscribers: Optional[List[WebSocket]] = None) -> bool:
         """
         发送消息通知
         
         Args:
             message: 消息对象
+            subscribers: 对话的WebSocket连接快照（见snapshot_subscribers），为None时发送前获取
         
         Returns:
             是否成功
         """
+        if subscribers is None:
+            subscribers = websocket_manager.snapshot_subscribers(message.dialogue_id)
+        
+        # 没有订阅者时无需构建和推送通知
+        if not subscribers:
+            return True
+        
         try:
-            # 构建通知消息
-            notification = {
-                "type": "new_message",
-                "message_id": message.id,
-                "dialogue_id": message.dialogue_id,
-                "session_id": message.session_id,
-                "turn_id": message.turn_id,
-                "sender_role": message.sender_role,
-                "sender_id": message.sender_id,
-                "content_type": message.content_type,
-                "created_at": message.created_at.isoformat()
-            }
-            
-            # 如果是文本内容，包含内容预览
-            if message.content_type == "text":
-                notification["content_preview"] = (
-                    message.content[:100] + "..." if len(message.content) > 100 else message.content
-                )
-            
-            # 推送给对话中的所有用户
-            success = await websocket_manager.send_to_dialogue(notification, message.dialogue_id)
+            # 构建通知消息（文本内容的预览在消息创建时已计算，其他类型为None）
+            notification = NewMessageNotification(
+                type="new_message",
+                message_id=message.id,
+                dialogue_id=message.dialogue_id,
+                session_id=message.session_id,
+                turn_id=message.turn_id,
+                sender_role=message.sender_role,
+                sender_id=message.sender_id,
+                content_type=message.content_type,
+                created_at=message.created_at,
+                content_preview=message.content_preview
+            )
+            
+            # 序列化一次，推送给对话中的所有用户
+            success = await websocket_manager.send_bytes_to_subscribers(orjson.dumps(notification), subscribers)
             
             if success:
-                logger.info(f"消息通知已发送: {message.id}")
+                logger.debug("消息通知已发送: %s", message.id)
             else:
-                logger.warning(f"消息通知发送失败: {message.id}")
+                logger.warning("消息通知发送失败: %s", message.id)
             
             return success
         
         except Exception as e:
-            logger.error(f"发送消息通知错误: {str(e)}")
+            logger.error("发送消息通知错误: %s", e)
             return False
     
-    async def send_processing_notification(self, message: Message) -> bool:
+    async def send_processing_notification(self, message: Message, subscribers: Optional[List[WebSocket]] = None) -> bool:
         """
         发送消息处理开始通知
         
         Args:
             message: 消息对象
+            subscribers: 对话的WebSocket连接快照（见snapshot_subscribers），为None时发送前获取
         
         Returns:
             是否成功
         """
+        if subscribers is None:
+            subscribers = websocket_manager.snapshot_subscribers(message.dialogue_id)
+        
+        # 没有订阅者时无需构建和推送通知
+        if not subscribers:
+            return True
+        
         try:
             # 构建通知消息
-            notification = {
-                "type": "processing_started",
-                "message_id": message.id,
-                "dialogue_id": message.dialogue_id,
-                "session_id": message.session_id,
-                "turn_id": message.turn_id,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
-            # 推送给对话中的所有用户
-            success = await websocket_manager.send_to_dialogue(notification, message.dialogue_id)
+            notification = ProcessingNotification(
+                type="processing_started",
+                message_id=message.id,
+                dialogue_id=message.dialogue_id,
+                session_id=message.session_id,
+                turn_id=message.turn_id,
+                timestamp=_utc_now()
+            )
+            
+            # 序列化一次，推送给对话中的所有用户
+            success = await websocket_manager.send_bytes_to_subscribers(orjson.dumps(notification), subscribers)
             
             if success:
-                logger.info(f"处理开始通知已发送: {message.id}")
+                logger.debug("处理开始通知已发送: %s", message.id)
             else:
-                logger.warning(f"处理开始通知发送失败: {message.id}")
+                logger.warning("处理开始通知发送失败: %s", message.id)
             
             return success
         
         except Exception as e:
-            logger.error(f"发送处理开始通知错误: {str(e)}")
+            logger.error("发送处理开始通知错误: %s", e)
             return False
     
-    async def send_processing_complete_notification(self, message_id: str, dialogue_id: str) -> bool:
+    async def send_processing_complete_notification(
+        self,
+        message_id: str,
+        dialogue_id: str,
+        subscribers: Optional[List[WebSocket]] = None
+    ) -> bool:
         """
         发送消息处理完成通知
         
         Args:
             message_id: 消息ID
             dialogue_id: 对话ID
+            subscribers: 对话的WebSocket连接快照（见snapshot_subscribers），为None时发送前获取
         
         Returns:
             是否成功
         """
+        if subscribers is None:
+            subscribers = websocket_manager.snapshot_subscribers(dialogue_id)
+        
+        # 没有订阅者时无需构建和推送通知
+        if not subscribers:
+            return True
+        
         try:
             # 构建通知消息
-            notification = {
-                "type": "processing_complete",
-                "message_id": message_id,
-                "dialogue_id": dialogue_id,
-                "timestamp": datetime.utcnow().isoformat()
-            }
+            notification = ProcessingCompleteNotification(
+                type="processing_complete",
+                message_id=message_id,
+                dialogue_id=dialogue_id,
+                timestamp=_utc_now()
+            )
             
-            # 推送给对话中的所有用户
-            success = await websocket_manager.send_to_dialogue(notification, dialogue_id)
+            # 序列化一次，推送给对话中的所有用户
+            success = await websocket_manager.send_bytes_to_subscribers(orjson.dumps(notification), subscribers)
             
             if success:
-                logger.info(f"处理完成通知已发送: {message_id}")
+                logger.debug("处理完成通知已发送: %s", message_id)
             else:
-                logger.warning(f"处理完成通知发送失败: {message_id}")
+                logger.warning("处理完成通知发送失败: %s", message_id)
             
             return success
         
         except Exception as e:
-            logger.error(f"发送处理完成通知错误: {str(e)}")
+            logger.error("发送处理完成通知错误: %s", e)
             return False
     
-    async def send_error_notification(self, dialogue_id: str, error_message: str) -> bool:
+    async def send_error_notification(
+        self,
+        dialogue_id: str,
+        error_message: str,
+        subscribers: Optional[List[WebSocket]] = None
+    ) -> bool:
         """
         发送错误通知
         
         Args:
             dialogue_id: 对话ID
             error_message: 错误信息
+            subscribers: 对话的WebSocket连接快照（见snapshot_subscribers），为None时发送前获取
         
         Returns:
             是否成功
         """
+        if subscribers is None:
+            subscribers = websocket_manager.snapshot_subscribers(dialogue_id)
+        
+        # 没有订阅者时无需构建和推送通知
+        if not subscribers:
+            return True
+        
         try:
             # 构建通知消息
-            notification = {
-                "type": "error",
-                "dialogue_id": dialogue_id,
-                "error": error_message,
-                "timestamp": datetime.utcnow().isoformat()
-            }
+            notification = ErrorNotification(
+                type="error",
+                dialogue_id=dialogue_id,
+                error=error_message,
+                timestamp=_utc_now()
+            )
             
-            # 推送给对话中的所有用户
-            success = await websocket_manager.send_to_dialogue(notification, dialogue_id)
+            # 序列化一次，推送给对话中的所有用户
+            success = await websocket_manager.send_bytes_to_subscribers(orjson.dumps(notification), subscribers)
             
             if success:
-                logger.info(f"错误通知已发送: {dialogue_id}")
+                logger.debug("错误通知已发送: %s", dialogue_id)
             else:
-                logger.warning(f"错误通知发送失败: {dialogue_id}")
+                logger.warning("错误通知发送失败: %s", dialogue_id)
             
             return success
         
         except Exception as e:
-            logger.error(f"发送错误通知错误: {str(e)}")
+            logger.error("发送错误通知错误: %s", e)
             return False
     
-    async def send_dialogue_update_notification(self, dialogue: Dialogue, update_type: str) -> bool:
+    async def send_dialogue_update_notification(
+        self,
+        dialogue: Dialogue,
+        update_type: str,
+        subscribers: Optional[List[WebSocket]] = None
+    ) -> bool:
         """
         发送对话更新通知
         
         Args:
             dialogue: 对话对象
             update_type: 更新类型
+            subscribers: 对话的WebSocket连接快照（见snapshot_subscribers），为None时发送前获取
         
         Returns:
             是否成功
         """
+        if subscribers is None:
+            subscribers = websocket_manager.snapshot_subscribers(dialogue.id)
+        
+        # 没有订阅者时无需构建和推送通知
+        if not subscribers:
+            return True
+        
         try:
             # 构建通知消息
-            notification = {
-                "type": "dialogue_update",
-                "dialogue_id": dialogue.id,
-                "update_type": update_type,
-                "is_active": dialogue.is_active,
-                "last_activity_at": dialogue.last_activity_at.isoformat(),
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
-            # 推送给对话中的所有用户
-            success = await websocket_manager.send_to_dialogue(notification, dialogue.id)
+            notification = DialogueUpdateNotification(
+                type="dialogue_update",
+                dialogue_id=dialogue.id,
+                update_type=update_type,
+                is_active=dialogue.is_active,
+                last_activity_at=dialogue.last_activity_at,
+                timestamp=_utc_now()
+            )
+            
+            # 序列化一次，推送给对话中的所有用户
+            success = await websocket_manager.send_bytes_to_subscribers(orjson.dumps(notification), subscribers)
             
             if success:
-                logger.info(f"对话更新通知已发送: {dialogue.id}, 类型: {update_type}")
+                logger.debug("对话更新通知已发送: %s, 类型: %s", dialogue.id, update_type)
             else:
-                logger.warning(f"对话更新通知发送失败: {dialogue.id}, 类型: {update_type}")
+                logger.warning("对话更新通知发送失败: %s, 类型: %s", dialogue.id, update_type)
             
             return success
         
         except Exception as e:
-            logger.error(f"发送对话更新通知错误: {str(e)}")
+            logger.error("发送对话更新通知错误: %s", e)
             return False
     
-    async def send_stream_response(self, dialogue_id: str, session_id: str, turn_id: str, content: str, is_complete: bool = False) -> bool:
+    async def send_stream_response(
+        self,
+        dialogue_id: str,
+        session_id: str,
+        turn_id: str,
+        content: str,
+        is_complete: bool = False,
+        subscribers: Optional[List[WebSocket]] = None
+    ) -> bool:
         """
         发送流式响应
         
@@ -207,34 +361,119 @@ class NotificationService:
             turn_id: 轮次ID
             content: 内容
             is_complete: 是否完成
+            subscribers: 对话的WebSocket连接快照（见snapshot_subscribers），为None时发送前获取
         
         Returns:
             是否成功
         """
+        if subscribers is None:
+            subscribers = websocket_manager.snapshot_subscribers(dialogue_id)
+        
+        # 没有订阅者时无需构建和推送通知
+        if not subscribers:
+            return True
+        
         try:
             # 构建流式响应消息
-            stream_message = {
-                "type": "stream_response",
-                "dialogue_id": dialogue_id,
-                "session_id": session_id,
-                "turn_id": turn_id,
-                "content": content,
-                "is_complete": is_complete,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
-            # 推送给对话中的所有用户
-            success = await websocket_manager.send_to_dialogue(stream_message, dialogue_id)
+            stream_message = StreamNotification(
+                type="stream_response",
+                dialogue_id=dialogue_id,
+                session_id=session_id,
+                turn_id=turn_id,
+                content=content,
+                is_complete=is_complete,
+                timestamp=_utc_now()
+            )
+            
+            # 序列化一次，推送给对话中的所有用户
+            success = await websocket_manager.send_bytes_to_subscribers(orjson.dumps(stream_message), subscribers)
             
             if not success:
-                logger.warning(f"流式响应发送失败: {dialogue_id}")
+                logger.warning("流式响应发送失败: %s", dialogue_id)
             
             return success
         
         except Exception as e:
-            logger.error(f"发送流式响应错误: {str(e)}")
+            logger.error("发送流式响应错误: %s", e)
             return False
 
 
+class StreamCoalescer:
+    """
+    流式响应合并器
+    LLM每产生一个片段都会触发一次回调，合并器在时间窗口内只推送最新内容，
+    减少WebSocket帧数。回调内容是累计文本，因此合并时只需保留最新一份。
+    """
+    
+    def __init__(
+        self,
+        send: Callable[[str, bool], Awaitable[Any]],
+        max_ms: int = 25,
+        max_chars: int = 512
+    ):
+        """
+        初始化合并器
+        
+        Args:
+            send: 实际发送函数，参数为(内容, 是否完成)
+            max_ms: 合并时间窗口（毫秒）
+            max_chars: 内容较上次推送增长超过该字符数时立即推送
+        """
+        self._send = send
+        self._delay = max_ms / 1000
+        self._max_chars = max_chars
+        self._pending: Optional[str] = None
+        self._sent_length = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: Set[asyncio.Task] = set()
+    
+    async def push(self, content: str, is_complete: bool) -> None:
+        """
+        接收一次流式回调
+        
+        Args:
+            content: 当前累计内容
+            is_complete: 是否完成
+        """
+        if is_complete:
+            # 完成帧立即推送，并丢弃尚未推送的中间内容
+            self._cancel_timer()
+            self._pending = None
+            if self._flush_tasks:
+                await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+            await self._deliver(content, True)
+            return
+        
+        self._pending = content
+        if len(content) - self._sent_length >= self._max_chars:
+            self._cancel_timer()
+            await self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._delay, self._on_timer)
+    
+    def _on_timer(self) -> None:
+        """时间窗口到期，推送最新内容"""
+        self._timer = None
+        task = asyncio.create_task(self._flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+    
+    def _cancel_timer(self) -> None:
+        """取消待触发的定时推送"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+    
+    async def _flush(self) -> None:
+        """推送缓存的最新内容"""
+        content, self._pending = self._pending, None
+        if content is not None:
+            await self._deliver(content, False)
+    
+    async def _deliver(self, content: str, is_complete: bool) -> None:
+        """调用实际发送函数"""
+        self._sent_length = len(content)
+        await self._send(content, is_complete)
+
 # 创建通知服务实例
 notification_service = NotificationService()
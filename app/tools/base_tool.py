@@ -2,14 +2,19 @@
 工具基础类
 定义工具接口和基本功能
 """
-import json
-import asyncio
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List, Union
+from functools import cached_property
+from time import perf_counter
+from typing import Dict, Any, Optional, List, Union, ClassVar
+
+import orjson
 from pydantic import BaseModel, Field
 
 from ..core.logger import logger
 
+# 未提供元数据时共用的空字典，避免每个结果都分配新字典（只读，不可修改）
+_EMPTY_METADATA: Dict[str, Any] = {}
+
 
 class ToolResult(BaseModel):
     """工具执行结果"""
@@ -31,29 +36,31 @@ class ToolResult(BaseModel):
         }
     
     def to_json(self) -> str:
-        """转换为JSON字符串"""
-        return json.dumps(self.to_dict(), ensure_ascii=False)
+        """转换为JSON字符串（非ASCII字符原样输出，无法直接序列化的元数据按字符串处理）"""
+        return orjson.dumps(self.to_dict(), default=str, option=orjson.OPT_NON_STR_KEYS).decode()
     
+    # 以下工厂方法的参数均来自内部代码，使用construct跳过字段校验
+    # 未提供元数据时metadata为共享的空字典，需要写入时应整体重新赋值
     @classmethod
     def success_result(cls, content: Any, content_type: str = "text", metadata: Dict[str, Any] = None) -> "ToolResult":
         """创建成功结果"""
-        return cls(
+        return cls.construct(
             success=True,
             content=content,
             content_type=content_type,
             error=None,
-            metadata=metadata or {}
+            metadata=metadata if metadata is not None else _EMPTY_METADATA
         )
     
     @classmethod
     def error_result(cls, error: str, metadata: Dict[str, Any] = None) -> "ToolResult":
         """创建错误结果"""
-        return cls(
+        return cls.construct(
             success=False,
             content=None,
             content_type="text",
             error=error,
-            metadata=metadata or {}
+            metadata=metadata if metadata is not None else _EMPTY_METADATA
         )
 
 
@@ -71,7 +78,6 @@ class BaseTool(ABC):
     
     def __init__(self):
         self.name = self.__class__.__name__
-        self.description = self.__doc__ or "未提供描述"
     
     @property
     @abstractmethod
@@ -97,37 +103,54 @@ class BaseTool(ABC):
         """工具版本"""
         pass
     
-    @property
-    def parameters(self) -> Dict[str, Any]:
-        """工具参数定义"""
-        return {}
+    # 以下为静态描述，子类以类属性覆盖（所有实例共享，不可修改）
+    # 工具参数定义
+    parameters: ClassVar[Dict[str, Any]] = {}
     
-    @property
-    def required_parameters(self) -> List[str]:
-        """必需参数列表"""
-        return []
+    # 必需参数列表
+    required_parameters: ClassVar[List[str]] = []
     
-    @property
-    def category(self) -> str:
-        """工具类别"""
-        return "general"
+    # 工具类别
+    category: ClassVar[str] = "general"
     
-    @property
-    def tags(self) -> List[str]:
-        """工具标签"""
-        return []
+    # 工具标签
+    tags: ClassVar[List[str]] = []
     
     @property
     def is_enabled(self) -> bool:
         """工具是否启用"""
         return True
     
+    @cached_property
+    def _required_set(self) -> frozenset:
+        """必需参数集合（首次访问时计算）"""
+        return frozenset(self.required_parameters)
+    
+    @cached_property
+    def _descriptor(self) -> Dict[str, Any]:
+        """
+        工具描述字典（首次访问时计算）
+        延迟到首次使用时构建，子类在__init__中设置的属性（如API密钥）此时已就绪
+        """
+        return {
+            "tool_id": self.tool_id,
+            "name": self.display_name,
+            "description": self.description,
+            "version": self.version,
+            "parameters": self.parameters,
+            "required_parameters": self.required_parameters,
+            "category": self.category,
+            "tags": self.tags,
+            "is_enabled": self.is_enabled
+        }
+    
     def validate_parameters(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """验证参数"""
-        # 检查必需参数
-        for param in self.required_parameters:
-            if param not in parameters:
-                raise ToolError(f"缺少必需参数: {param}")
+        # 检查必需参数（按定义顺序报告第一个缺失的参数）
+        if not self._required_set.issubset(parameters):
+            for param in self.required_parameters:
+                if param not in parameters:
+                    raise ToolError(f"缺少必需参数: {param}")
         
         # 返回验证后的参数
         return parameters
@@ -145,29 +168,22 @@ class BaseTool(ABC):
         """
         context = context or {}
         
-        # 记录工具调用
-        logger.log_tool_call(
-            tool_id=self.tool_id,
-            dialogue_id=context.get("dialogue_id"),
-            turn_id=context.get("turn_id"),
-            parameters=parameters,
-            execution_time=0,  # 将在执行后更新
-            success=True  # 将在执行后更新
-        )
+        # 调用结果在执行后统一记录一次，这里只记录调试日志
+        logger.debug("Tool start: %s", self.tool_id)
         
         try:
             # 验证参数
             validated_params = self.validate_parameters(parameters)
             
             # 执行工具逻辑
-            start_time = asyncio.get_event_loop().time()
+            start_time = perf_counter()
             result = await self._execute(validated_params, context)
-            end_time = asyncio.get_event_loop().time()
+            end_time = perf_counter()
             
             # 计算执行时间（毫秒）
             execution_time = (end_time - start_time) * 1000
             
-            # 更新工具调用日志
+            # 记录工具调用
             logger.log_tool_call(
                 tool_id=self.tool_id,
                 dialogue_id=context.get("dialogue_id"),
@@ -223,16 +239,10 @@ class BaseTool(ABC):
         """
         pass
     
+    async def close(self) -> None:
+        """释放工具持有的资源（如HTTP连接池），默认无需处理"""
+        pass
+    
     def to_dict(self) -> Dict[str, Any]:
-        """转换为字典"""
-        return {
-            "tool_id": self.tool_id,
-            "name": self.display_name,
-            "description": self.description,
-            "version": self.version,
-            "parameters": self.parameters,
-            "required_parameters": self.required_parameters,
-            "category": self.category,
-            "tags": self.tags,
-            "is_enabled": self.is_enabled
-        }
+        """转换为字典（返回缓存描述的浅拷贝）"""
+        return dict(self._descriptor)
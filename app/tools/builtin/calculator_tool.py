@@ -2,14 +2,137 @@
 计算器工具
 提供基本的数学计算功能
 """
-import re
+import ast
 import math
-import operator
-from typing import Dict, Any, List, Optional, Union
-from sympy import sympify, SympifyError
+import sys
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Union, ClassVar
 
 from ..base_tool import BaseTool, ToolResult, ToolError
 
+# 指数绝对值（及阶乘参数）上限，防止如9**9**9的超大运算耗尽CPU和内存
+_MAX_EXPONENT = 10000
+
+# 整数结果的十进制位数上限，与Python 3.11+整数转字符串的位数限制一致（未限制或更早的版本按默认的4300位）
+# 超过该限制的整数无法转为字符串返回
+_MAX_RESULT_DIGITS = getattr(sys, "get_int_max_str_digits", lambda: 0)() or 4300
+_MAX_RESULT_BITS = int(_MAX_RESULT_DIGITS / math.log10(2))
+
+
+def _safe_pow(base: Union[int, float], exponent: Union[int, float]) -> Union[int, float]:
+    """带指数和结果大小上限的幂运算"""
+    if abs(exponent) > _MAX_EXPONENT:
+        raise OverflowError("指数过大")
+    # 只限制指数无法阻止嵌套幂运算，如(10**10000)**10000，整数幂运算前先估算结果位数
+    # 结果位数不少于 (底数位数-1) × 指数；浮点运算溢出时由Python直接抛出OverflowError
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0:
+        if (abs(base).bit_length() - 1) * exponent > _MAX_RESULT_BITS:
+            raise OverflowError("计算结果过大")
+    return base ** exponent
+
+
+def _safe_factorial(n: int) -> int:
+    """带上限的阶乘"""
+    if n > _MAX_EXPONENT:
+        raise OverflowError("阶乘参数过大")
+    return math.factorial(n)
+
+
+# 表达式中允许使用的函数和常量
+_SAFE_NAMES: Dict[str, Any] = {
+    "abs": abs,
+    "round": round,
+    "min": min,
+    "max": max,
+    "sqrt": math.sqrt,
+    "exp": math.exp,
+    "log": math.log,
+    "log10": math.log10,
+    "log2": math.log2,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "asin": math.asin,
+    "acos": math.acos,
+    "atan": math.atan,
+    "sinh": math.sinh,
+    "cosh": math.cosh,
+    "tanh": math.tanh,
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "factorial": _safe_factorial,
+    "pi": math.pi,
+    "e": math.e,
+    "_pow": _safe_pow,
+}
+
+# 允许的语法节点：数字、四则/取模/幂运算、正负号、白名单函数调用
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name, ast.Load, ast.Call,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd,
+)
+
+
+class _PowRewriter(ast.NodeTransformer):
+    """将幂运算改写为_pow调用，以便检查指数大小"""
+    
+    def visit_BinOp(self, node: ast.BinOp) -> ast.AST:
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Pow):
+            return ast.copy_location(
+                ast.Call(func=ast.Name(id="_pow", ctx=ast.Load()), args=[node.left, node.right], keywords=[]),
+                node
+            )
+        return node
+
+
+@lru_cache(maxsize=1024)
+def _compile_expression(expression: str):
+    """
+    校验并编译数学表达式
+    
+    Args:
+        expression: 数学表达式，^与**等价
+    
+    Returns:
+        编译后的代码对象
+    
+    Raises:
+        SyntaxError: 表达式语法错误或包含不允许的内容
+    """
+    tree = ast.parse(expression.replace("^", "**"), mode="eval")
+    
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise SyntaxError(f"不支持的语法: {type(node).__name__}")
+        if isinstance(node, ast.Constant) and (
+            isinstance(node.value, bool) or not isinstance(node.value, (int, float))
+        ):
+            raise SyntaxError(f"不支持的常量: {node.value!r}")
+        if isinstance(node, ast.Name) and node.id not in _SAFE_NAMES:
+            raise SyntaxError(f"未知的名称: {node.id}")
+        if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.keywords):
+            raise SyntaxError("只支持直接调用内置数学函数")
+    
+    tree = ast.fix_missing_locations(_PowRewriter().visit(tree))
+    return compile(tree, "<calc>", "eval")
+
+
+def _check_result(result: Any) -> None:
+    """
+    检查计算结果可以作为实数返回
+    
+    Raises:
+        ValueError: 结果为复数（如负数的分数次幂）或非有限浮点数
+        OverflowError: 整数结果超过位数上限
+    """
+    if isinstance(result, complex):
+        raise ValueError("计算结果不是实数")
+    if isinstance(result, float) and not math.isfinite(result):
+        raise ValueError("计算结果溢出或未定义")
+    if isinstance(result, int) and result.bit_length() > _MAX_RESULT_BITS:
+        raise OverflowError("计算结果过大")
+
 
 class CalculatorTool(BaseTool):
     """计算器工具，提供基本的数学计算功能"""
@@ -30,26 +153,18 @@ class CalculatorTool(BaseTool):
     def version(self) -> str:
         return "1.0.0"
     
-    @property
-    def parameters(self) -> Dict[str, Any]:
-        return {
-            "expression": {
-                "type": "string",
-                "description": "要计算的数学表达式"
-            }
+    parameters: ClassVar[Dict[str, Any]] = {
+        "expression": {
+            "type": "string",
+            "description": "要计算的数学表达式"
         }
+    }
     
-    @property
-    def required_parameters(self) -> List[str]:
-        return ["expression"]
+    required_parameters: ClassVar[List[str]] = ["expression"]
     
-    @property
-    def category(self) -> str:
-        return "utility"
+    category: ClassVar[str] = "utility"
     
-    @property
-    def tags(self) -> List[str]:
-        return ["math", "calculator", "utility"]
+    tags: ClassVar[List[str]] = ["math", "calculator", "utility"]
     
     async def _execute(self, parameters: Dict[str, Any], context: Dict[str, Any]) -> ToolResult:
         """
@@ -68,14 +183,13 @@ class CalculatorTool(BaseTool):
             return ToolResult.error_result("表达式不能为空")
         
         try:
-            # 使用sympy进行安全计算
-            result = sympify(expression)
+            # 表达式经白名单校验后编译（按表达式缓存），在受限命名空间中求值
+            result = eval(_compile_expression(expression), {"__builtins__": {}}, _SAFE_NAMES)
+            _check_result(result)
             
-            # 转换为浮点数或整数
-            if result.is_Integer:
+            # 整数值的浮点结果按整数返回
+            if isinstance(result, float) and result.is_integer() and abs(result) < 1e15:
                 result = int(result)
-            elif result.is_Float:
-                result = float(result)
             
             return ToolResult.success_result(
                 content=str(result),
@@ -86,7 +200,7 @@ class CalculatorTool(BaseTool):
                 }
             )
         
-        except SympifyError as e:
+        except SyntaxError as e:
             return ToolResult.error_result(f"无效的数学表达式: {str(e)}")
         
         except Exception as e:
@@ -2,9 +2,9 @@
 搜索工具
 提供网络搜索功能
 """
-import json
 import aiohttp
-from typing import Dict, Any, List, Optional
+import orjson
+from typing import Dict, Any, List, Optional, ClassVar
 
 from ...config import get_config
 from ..base_tool import BaseTool, ToolResult, ToolError
@@ -18,6 +18,32 @@ class SearchTool(BaseTool):
         config = get_config()
         self.api_key = config["tools"]["search_api_key"]
         self.api_url = "https://api.bing.microsoft.com/v7.0/search"
+        # 请求头不随请求变化，只构建一次（只读，不可修改）
+        self._base_headers = {
+            "Ocp-Apim-Subscription-Key": self.api_key,
+            "Accept": "application/json"
+        }
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """
+        获取复用的HTTP会话（首次使用时创建，连接池保持长连接）
+        
+        Returns:
+            HTTP会话
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=10)
+            )
+        return self._session
+    
+    async def close(self) -> None:
+        """关闭HTTP会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
     @property
     def tool_id(self) -> str:
@@ -35,38 +61,30 @@ class SearchTool(BaseTool):
     def version(self) -> str:
         return "1.0.0"
     
-    @property
-    def parameters(self) -> Dict[str, Any]:
-        return {
-            "query": {
-                "type": "string",
-                "description": "搜索查询词"
-            },
-            "count": {
-                "type": "integer",
-                "description": "返回结果数量",
-                "default": 5,
-                "minimum": 1,
-                "maximum": 10
-            },
-            "market": {
-                "type": "string",
-                "description": "搜索市场，例如zh-CN表示中国",
-                "default": "zh-CN"
-            }
+    parameters: ClassVar[Dict[str, Any]] = {
+        "query": {
+            "type": "string",
+            "description": "搜索查询词"
+        },
+        "count": {
+            "type": "integer",
+            "description": "返回结果数量",
+            "default": 5,
+            "minimum": 1,
+            "maximum": 10
+        },
+        "market": {
+            "type": "string",
+            "description": "搜索市场，例如zh-CN表示中国",
+            "default": "zh-CN"
         }
+    }
     
-    @property
-    def required_parameters(self) -> List[str]:
-        return ["query"]
+    required_parameters: ClassVar[List[str]] = ["query"]
     
-    @property
-    def category(self) -> str:
-        return "information"
+    category: ClassVar[str] = "information"
     
-    @property
-    def tags(self) -> List[str]:
-        return ["search", "information", "api"]
+    tags: ClassVar[List[str]] = ["search", "information", "api"]
     
     @property
     def is_enabled(self) -> bool:
@@ -93,12 +111,6 @@ class SearchTool(BaseTool):
         if not query:
             return ToolResult.error_result("搜索查询不能为空")
         
-        # 构建请求头
-        headers = {
-            "Ocp-Apim-Subscription-Key": self.api_key,
-            "Accept": "application/json"
-        }
-        
         # 构建查询参数
         query_params = {
             "q": query,
@@ -108,49 +120,52 @@ class SearchTool(BaseTool):
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.api_url, params=query_params, headers=headers) as response:
-                    if response.status != 200:
-                        error_data = await response.text()
-                        return ToolResult.error_result(f"搜索API错误: {error_data}")
-                    
-                    data = await response.json()
-                    
-                    # 提取搜索结果
-                    web_pages = data.get("webPages", {}).get("value", [])
-                    
-                    if not web_pages:
-                        return ToolResult.success_result(
-                            content="未找到相关搜索结果",
-                            content_type="text",
-                            metadata={"query": query, "results": []}
-                        )
-                    
-                    # 格式化搜索结果
-                    results = []
-                    for page in web_pages:
-                        results.append({
-                            "title": page.get("name", ""),
-                            "url": page.get("url", ""),
-                            "snippet": page.get("snippet", "")
-                        })
-                    
-                    # 构建人类可读的搜索结果摘要
-                    summary = f"搜索 \"{query}\" 的结果：\n\n"
-                    for i, result in enumerate(results, 1):
-                        summary += f"{i}. {result['title']}\n"
-                        summary += f"   {result['snippet']}\n"
-                        summary += f"   {result['url']}\n\n"
-                    
+            session = await self._get_session()
+            async with session.get(self.api_url, params=query_params, headers=self._base_headers) as response:
+                if response.status != 200:
+                    error_data = await response.text()
+                    return ToolResult.error_result(f"搜索API错误: {error_data}")
+                
+                # 直接读取响应体用orjson解析，跳过aiohttp的内容类型检查和标准库解析
+                data = orjson.loads(await response.read())
+                
+                # 提取搜索结果
+                web_pages = data.get("webPages", {}).get("value", [])
+                
+                if not web_pages:
                     return ToolResult.success_result(
-                        content=summary.strip(),
+                        content="未找到相关搜索结果",
                         content_type="text",
-                        metadata={
-                            "query": query,
-                            "results": results,
-                            "total_results": len(results)
-                        }
+                        metadata={"query": query, "results": []}
                     )
+                
+                # 格式化搜索结果
+                results = [
+                    {
+                        "title": page.get("name", ""),
+                        "url": page.get("url", ""),
+                        "snippet": page.get("snippet", "")
+                    }
+                    for page in web_pages
+                ]
+                
+                # 构建人类可读的搜索结果摘要（各段拼接一次完成）
+                parts = [f"搜索 \"{query}\" 的结果：\n"]
+                parts.extend(
+                    f"{i}. {result['title']}\n   {result['snippet']}\n   {result['url']}\n"
+                    for i, result in enumerate(results, 1)
+                )
+                summary = "\n".join(parts)
+                
+                return ToolResult.success_result(
+                    content=summary.strip(),
+                    content_type="text",
+                    metadata={
+                        "query": query,
+                        "results": results,
+                        "total_results": len(results)
+                    }
+                )
         
         except aiohttp.ClientError as e:
             return ToolResult.error_result(f"网络请求错误: {str(e)}")
@@ -2,13 +2,16 @@
 天气工具
 提供天气查询功能
 """
-import json
 import aiohttp
-from typing import Dict, Any, List, Optional
+import orjson
+from typing import Dict, Any, List, Optional, ClassVar
 
 from ...config import get_config
 from ..base_tool import BaseTool, ToolResult, ToolError
 
+# 响应中缺少某个分组时使用的空字典（只读）
+_EMPTY: Dict[str, Any] = {}
+
 
 class WeatherTool(BaseTool):
     """天气工具，提供天气查询功能"""
@@ -18,6 +21,32 @@ class WeatherTool(BaseTool):
         config = get_config()
         self.api_key = config["tools"]["weather_api_key"]
         self.api_url = "https://api.openweathermap.org/data/2.5/weather"
+        # 固定查询参数只构建一次，每次请求在其副本上补充变量参数
+        self._base_params = {
+            "appid": self.api_key,
+            "lang": "zh_cn"  # 使用中文返回结果
+        }
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """
+        获取复用的HTTP会话（首次使用时创建，连接池保持长连接）
+        
+        Returns:
+            HTTP会话
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=10)
+            )
+        return self._session
+    
+    async def close(self) -> None:
+        """关闭HTTP会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
     @property
     def tool_id(self) -> str:
@@ -35,36 +64,28 @@ class WeatherTool(BaseTool):
     def version(self) -> str:
         return "1.0.0"
     
-    @property
-    def parameters(self) -> Dict[str, Any]:
-        return {
-            "city": {
-                "type": "string",
-                "description": "城市名称，可以是中文或英文"
-            },
-            "country_code": {
-                "type": "string",
-                "description": "国家代码，例如CN表示中国（可选）"
-            },
-            "units": {
-                "type": "string",
-                "description": "温度单位，metric表示摄氏度，imperial表示华氏度",
-                "enum": ["metric", "imperial"],
-                "default": "metric"
-            }
+    parameters: ClassVar[Dict[str, Any]] = {
+        "city": {
+            "type": "string",
+            "description": "城市名称，可以是中文或英文"
+        },
+        "country_code": {
+            "type": "string",
+            "description": "国家代码，例如CN表示中国（可选）"
+        },
+        "units": {
+            "type": "string",
+            "description": "温度单位，metric表示摄氏度，imperial表示华氏度",
+            "enum": ["metric", "imperial"],
+            "default": "metric"
         }
+    }
     
-    @property
-    def required_parameters(self) -> List[str]:
-        return ["city"]
+    required_parameters: ClassVar[List[str]] = ["city"]
     
-    @property
-    def category(self) -> str:
-        return "information"
+    category: ClassVar[str] = "information"
     
-    @property
-    def tags(self) -> List[str]:
-        return ["weather", "information", "api"]
+    tags: ClassVar[List[str]] = ["weather", "information", "api"]
     
     @property
     def is_enabled(self) -> bool:
@@ -93,51 +114,59 @@ class WeatherTool(BaseTool):
         
         # 构建查询参数
         query_params = {
+            **self._base_params,
             "q": f"{city},{country_code}" if country_code else city,
-            "appid": self.api_key,
-            "units": units,
-            "lang": "zh_cn"  # 使用中文返回结果
+            "units": units
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.api_url, params=query_params) as response:
-                    if response.status != 200:
-                        error_data = await response.text()
-                        return ToolResult.error_result(f"天气API错误: {error_data}")
-                    
-                    data = await response.json()
-                    
-                    # 提取有用的天气信息
-                    weather_info = {
-                        "city": data.get("name", city),
-                        "country": data.get("sys", {}).get("country", country_code),
-                        "weather": data.get("weather", [{}])[0].get("description", "未知"),
-                        "temperature": data.get("main", {}).get("temp", 0),
-                        "feels_like": data.get("main", {}).get("feels_like", 0),
-                        "humidity": data.get("main", {}).get("humidity", 0),
-                        "pressure": data.get("main", {}).get("pressure", 0),
-                        "wind_speed": data.get("wind", {}).get("speed", 0),
-                        "wind_direction": data.get("wind", {}).get("deg", 0),
-                        "clouds": data.get("clouds", {}).get("all", 0),
-                        "timestamp": data.get("dt", 0)
-                    }
-                    
-                    # 构建人类可读的天气描述
-                    temp_unit = "°C" if units == "metric" else "°F"
-                    weather_description = (
-                        f"{weather_info['city']}的天气：{weather_info['weather']}，"
-                        f"温度{weather_info['temperature']}{temp_unit}，"
-                        f"体感温度{weather_info['feels_like']}{temp_unit}，"
-                        f"湿度{weather_info['humidity']}%，"
-                        f"风速{weather_info['wind_speed']}m/s"
-                    )
-                    
-                    return ToolResult.success_result(
-                        content=weather_description,
-                        content_type="text",
-                        metadata=weather_info
-                    )
+            session = await self._get_session()
+            async with session.get(self.api_url, params=query_params) as response:
+                if response.status != 200:
+                    error_data = await response.text()
+                    return ToolResult.error_result(f"天气API错误: {error_data}")
+                
+                # 直接读取响应体用orjson解析，跳过aiohttp的内容类型检查和标准库解析
+                data = orjson.loads(await response.read())
+                
+                # 各分组只取一次，缺失时使用共享的空字典，不在每次调用时分配默认值
+                main = data.get("main") or _EMPTY
+                wind = data.get("wind") or _EMPTY
+                weather_list = data.get("weather")
+                
+                # 提取有用的天气信息
+                city_name = data.get("name", city)
+                weather = (weather_list[0] if weather_list else _EMPTY).get("description", "未知")
+                temperature = main.get("temp", 0)
+                feels_like = main.get("feels_like", 0)
+                humidity = main.get("humidity", 0)
+                wind_speed = wind.get("speed", 0)
+                weather_info = {
+                    "city": city_name,
+                    "country": (data.get("sys") or _EMPTY).get("country", country_code),
+                    "weather": weather,
+                    "temperature": temperature,
+                    "feels_like": feels_like,
+                    "humidity": humidity,
+                    "pressure": main.get("pressure", 0),
+                    "wind_speed": wind_speed,
+                    "wind_direction": wind.get("deg", 0),
+                    "clouds": (data.get("clouds") or _EMPTY).get("all", 0),
+                    "timestamp": data.get("dt", 0)
+                }
+                
+                # 构建人类可读的天气描述
+                temp_unit = "°C" if units == "metric" else "°F"
+                weather_description = (
+                    f"{city_name}的天气：{weather}，温度{temperature}{temp_unit}，"
+                    f"体感温度{feels_like}{temp_unit}，湿度{humidity}%，风速{wind_speed}m/s"
+                )
+                
+                return ToolResult.success_result(
+                    content=weather_description,
+                    content_type="text",
+                    metadata=weather_info
+                )
         
         except aiohttp.ClientError as e:
             return ToolResult.error_result(f"网络请求错误: {str(e)}")
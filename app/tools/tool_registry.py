@@ -2,11 +2,17 @@
 工具注册表
 用于管理和调用各种工具
 """
+import asyncio
 import importlib
+import inspect
+import os
 import pkgutil
-from typing import Dict, Any, List, Type, Optional, Callable, Union
+from functools import cached_property
+from typing import Dict, Any, List, Type, Optional, Callable, Set, Tuple, Union
 from concurrent.futures import ThreadPoolExecutor
 
+import orjson
+
 from .base_tool import BaseTool, ToolResult
 from ..core.logger import logger
 
@@ -16,7 +22,40 @@ class ToolRegistry:
     
     def __init__(self):
         self._tools: Dict[str, BaseTool] = {}
-        self._executor = ThreadPoolExecutor(max_workers=10)
+        # 工具集合版本号，注册/注销时递增，用于判断缓存是否过期
+        self._version = 0
+        # (版本号, 类别列表)
+        self._categories_cache: Tuple[int, List[str]] = (-1, [])
+        # (类别, 是否只列出已启用) -> (版本号, 工具列表)
+        self._list_cache: Dict[Tuple[Optional[str], bool], Tuple[int, List[Dict[str, Any]]]] = {}
+        # (类别, 是否只列出已启用) -> 序列化后的工具列表JSON，注册/注销时清空
+        self._json_cache: Dict[Tuple[Optional[str], bool], bytes] = {}
+        # 已扫描过的包路径，重复调用discover_tools时直接跳过
+        self._discovered: Set[str] = set()
+    
+    @cached_property
+    def _executor(self) -> ThreadPoolExecutor:
+        """
+        同步工具使用的线程池（首次使用时创建，内置工具均为异步实现，通常不会创建）
+        
+        Returns:
+            线程池
+        """
+        return ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4))
+    
+    async def run_sync(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        在线程池中执行阻塞函数，避免阻塞事件循环
+        
+        Args:
+            fn: 同步函数
+            *args: 函数参数
+        
+        Returns:
+            函数返回值
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
     
     def register(self, tool: BaseTool) -> None:
         """
@@ -33,6 +72,8 @@ class ToolRegistry:
             logger.warning(f"工具ID '{tool_id}' 已存在，将被覆盖")
         
         self._tools[tool_id] = tool
+        self._version += 1
+        self._json_cache.clear()
         logger.info(f"工具 '{tool_id}' 已注册")
     
     def unregister(self, tool_id: str) -> bool:
@@ -47,6 +88,8 @@ class ToolRegistry:
         """
         if tool_id in self._tools:
             del self._tools[tool_id]
+            self._version += 1
+            self._json_cache.clear()
             logger.info(f"工具 '{tool_id}' 已注销")
             return True
         
@@ -74,20 +117,48 @@ class ToolRegistry:
             enabled_only: 是否只列出已启用的工具
         
         Returns:
-            工具列表
+            工具列表（列表中的字典为共享缓存，调用方不应修改）
         """
+        key = (category, enabled_only)
+        cached = self._list_cache.get(key)
+        if cached is not None and cached[0] == self._version:
+            return list(cached[1])
+        
         tools = []
+        append = tools.append
         
         for tool in self._tools.values():
-            if enabled_only and not tool.is_enabled:
+            # 使用工具的缓存描述过滤，避免重复读取属性
+            descriptor = tool.to_dict()
+            
+            if enabled_only and not descriptor["is_enabled"]:
                 continue
             
-            if category and tool.category != category:
+            if category and descriptor["category"] != category:
                 continue
             
-            tools.append(tool.to_dict())
+            append(descriptor)
+        
+        self._list_cache[key] = (self._version, tools)
+        return list(tools)
+    
+    def list_tools_json(self, category: Optional[str] = None, enabled_only: bool = True) -> bytes:
+        """
+        列出工具（已序列化为JSON）
+        
+        Args:
+            category: 工具类别，如果为None则列出所有类别
+            enabled_only: 是否只列出已启用的工具
         
-        return tools
+        Returns:
+            工具列表的JSON字节串
+        """
+        key = (category, enabled_only)
+        payload = self._json_cache.get(key)
+        if payload is None:
+            payload = orjson.dumps(self.list_tools(category, enabled_only), default=str)
+            self._json_cache[key] = payload
+        return payload
     
     def get_categories(self) -> List[str]:
         """
@@ -96,13 +167,20 @@ class ToolRegistry:
         Returns:
             类别列表
         """
+        version, cached = self._categories_cache
+        if version == self._version:
+            return list(cached)
+        
         categories = set()
         
         for tool in self._tools.values():
-            if tool.is_enabled:
-                categories.add(tool.category)
+            descriptor = tool.to_dict()
+            if descriptor["is_enabled"]:
+                categories.add(descriptor["category"])
         
-        return sorted(list(categories))
+        result = sorted(categories)
+        self._categories_cache = (self._version, result)
+        return list(result)
     
     async def execute_tool(self, tool_id: str, parameters: Dict[str, Any], context: Dict[str, Any] = None) -> ToolResult:
         """
@@ -116,8 +194,8 @@ class ToolRegistry:
         Returns:
             执行结果
         """
-        tool = self.get_tool(tool_id)
-        if not tool:
+        tool = self._tools.get(tool_id)
+        if tool is None:
             error_message = f"工具 '{tool_id}' 不存在"
             logger.error(error_message)
             return ToolResult.error_result(error_message)
@@ -134,6 +212,18 @@ class ToolRegistry:
             logger.error(error_message)
             return ToolResult.error_result(error_message)
     
+    async def close(self) -> None:
+        """关闭所有已注册工具持有的资源，以及已创建的线程池"""
+        for tool_id, tool in self._tools.items():
+            try:
+                await tool.close()
+            except Exception as e:
+                logger.error(f"关闭工具 '{tool_id}' 时发生错误: {str(e)}")
+        
+        executor = self.__dict__.pop("_executor", None)
+        if executor is not None:
+            executor.shutdown(wait=False)
+    
     def discover_tools(self, package_path: str) -> int:
         """
         自动发现并注册工具
@@ -142,39 +232,49 @@ class ToolRegistry:
             package_path: 工具包路径，例如 'app.tools.builtin'
         
         Returns:
-            注册的工具数量
+            本次新注册的工具数量（已扫描过的包返回0）
         """
+        if package_path in self._discovered:
+            return 0
+        self._discovered.add(package_path)
+        
         count = 0
         package = importlib.import_module(package_path)
         
-        for _, name, is_pkg in pkgutil.iter_modules(package.__path__, package.__name__ + '.'):
+        # walk_packages一次遍历所有子包中的模块，子包导入失败时记录日志并跳过
+        def on_error(name: str) -> None:
+            logger.error(f"导入包 '{name}' 时发生错误")
+        
+        for _, name, is_pkg in pkgutil.walk_packages(package.__path__, package.__name__ + '.', onerror=on_error):
             if is_pkg:
-                # 如果是包，递归搜索
-                count += self.discover_tools(name)
-            else:
-                try:
-                    # 导入模块
-                    module = importlib.import_module(name)
+                # 子包已由walk_packages展开，记录下来避免之后被单独重复扫描
+                self._discovered.add(name)
+                continue
+            
+            try:
+                # 导入模块
+                module = importlib.import_module(name)
+                
+                # 查找模块中的工具类（模块定义了__all__时只检查导出的名称）
+                namespace = vars(module)
+                for attr_name in getattr(module, "__all__", None) or list(namespace):
+                    attr = namespace.get(attr_name)
                     
-                    # 查找模块中的工具类
-                    for attr_name in dir(module):
-                        attr = getattr(module, attr_name)
+                    # 检查是否是BaseTool的子类（不包括BaseTool本身）
+                    if (inspect.isclass(attr) and 
+                        issubclass(attr, BaseTool) and 
+                        attr is not BaseTool):
                         
-                        # 检查是否是BaseTool的子类（不包括BaseTool本身）
-                        if (isinstance(attr, type) and 
-                            issubclass(attr, BaseTool) and 
-                            attr is not BaseTool):
-                            
-                            try:
-                                # 实例化工具并注册
-                                tool = attr()
-                                self.register(tool)
-                                count += 1
-                            except Exception as e:
-                                logger.error(f"实例化工具 '{attr_name}' 时发生错误: {str(e)}")
-                
-                except Exception as e:
-                    logger.error(f"导入模块 '{name}' 时发生错误: {str(e)}")
+                        try:
+                            # 实例化工具并注册
+                            tool = attr()
+                            self.register(tool)
+                            count += 1
+                        except Exception as e:
+                            logger.error(f"实例化工具 '{attr_name}' 时发生错误: {str(e)}")
+            
+            except Exception as e:
+                logger.error(f"导入模块 '{name}' 时发生错误: {str(e)}")
         
         return count
 
@@ -0,0 +1,235 @@
+"""
+测试公共配置
+"""
+import asyncio
+import copy
+import os
+import re
+import uuid
+from typing import Any, Dict, List, Optional
+
+import pytest
+import pytest_asyncio
+
+from app.db.database import Database
+from app.db.repositories import clear_entity_cache
+
+# 测试中使用到的表，每个测试结束后清空
+TEST_TABLES = ("test", "message", "turn", "session", "dialogue")
+
+
+# 设置后数据库测试同时在真实的SurrealDB实例上运行，如 ws://localhost:8000/rpc
+SURREAL_TEST_URL = os.getenv("SURREAL_TEST_URL")
+# 真实实例上使用的测试数据库（测试结束后清空其中的测试表，不要指向业务数据库）
+SURREAL_TEST_DATABASE = os.getenv("SURREAL_TEST_DATABASE", "dialogue_test")
+
+# SurrealQL的NONE（字段不存在），与NULL（字段值为None）区分
+_NONE = object()
+
+# DictDatabase.query支持的SurrealQL语句（仅限存储库实际使用的形式）
+_SELECT_RE = re.compile(r"SELECT \* FROM (\w+)(?: WHERE (.+?))?(?: ORDER BY (\w+)( DESC)?)?(?: LIMIT \$(\w+))?$")
+_UPDATE_ONE_RE = re.compile(r"UPDATE type::thing\('(\w+)', \$(\w+)\) SET (.+)$")
+_UPDATE_WHERE_RE = re.compile(r"UPDATE (\w+) SET (.+?) WHERE (.+)$")
+_INSERT_RE = re.compile(r"INSERT INTO (\w+) \$(\w+)$")
+_CONDITION_RE = re.compile(r"(meta::id\(id\)|\w+) (=|<|IN|IS) (.+)$")
+_ASSIGNMENT_RE = re.compile(r"(\w+) (\+?=) (.+)$")
+
+
+class DictDatabase(Database):
+    """
+    基于字典的内存数据库，接口和返回值与Database一致
+    记录存放在 表名 -> {记录ID: 记录} 的字典中，不经过SurrealDB客户端；
+    query只支持存储库使用的SELECT/UPDATE/INSERT语句形式，其他语句抛出ValueError；
+    与SurrealDB一致区分NONE和NULL：记录中不存在的字段为NONE，值为None的字段为NULL
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.db_url = "memory"
+        self._tables: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    
+    async def connect(self) -> bool:
+        self.connected = True
+        return True
+    
+    async def disconnect(self) -> bool:
+        self.connected = False
+        return True
+    
+    def _insert(self, table: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        record_id = data.get("id") or str(uuid.uuid4())
+        record = copy.deepcopy({**data, "id": record_id})
+        self._tables.setdefault(table, {})[record_id] = record
+        return copy.deepcopy(record)
+    
+    async def create(self, table: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return self._insert(table, data)
+    
+    async def select(self, table: str, id: Optional[str] = None) -> List[Dict[str, Any]]:
+        records = self._tables.get(table, {})
+        if id:
+            record = records.get(id)
+            return [copy.deepcopy(record)] if record is not None else []
+        return [copy.deepcopy(record) for record in records.values()]
+    
+    async def update(self, table: str, id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        records = self._tables.get(table, {})
+        if id not in records:
+            return None
+        # 与SurrealDB的update一致，整体替换记录内容
+        records[id] = copy.deepcopy({**data, "id": id})
+        return copy.deepcopy(records[id])
+    
+    async def delete(self, table: str, id: str) -> bool:
+        self._tables.get(table, {}).pop(id, None)
+        return True
+    
+    async def delete_all(self, table: str) -> bool:
+        self._tables.pop(table, None)
+        return True
+    
+    async def query(self, query: str, params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        params = params or {}
+        query = " ".join(query.split())
+        
+        match = _SELECT_RE.match(query)
+        if match:
+            table, where, order_by, desc, limit = match.groups()
+            rows = self._where(table, where, params)
+            if order_by:
+                rows.sort(key=lambda row: (row.get(order_by) is None, row.get(order_by)), reverse=bool(desc))
+            if limit:
+                rows = rows[:params[limit]]
+            return [copy.deepcopy(row) for row in rows]
+        
+        match = _UPDATE_ONE_RE.match(query)
+        if match:
+            table, id_param, assignments = match.groups()
+            record = self._tables.get(table, {}).get(params[id_param])
+            rows = [record] if record is not None else []
+            return self._assign(rows, assignments, params)
+        
+        match = _UPDATE_WHERE_RE.match(query)
+        if match:
+            table, assignments, where = match.groups()
+            return self._assign(self._where(table, where, params), assignments, params)
+        
+        match = _INSERT_RE.match(query)
+        if match:
+            table, data_param = match.groups()
+            return [self._insert(table, data) for data in params[data_param]]
+        
+        raise ValueError(f"DictDatabase不支持的查询: {query}")
+    
+    @staticmethod
+    def _value(token: str, params: Dict[str, Any]) -> Any:
+        """解析语句中的参数或字面量"""
+        if token.startswith("$"):
+            return params[token[1:]]
+        if token == "NONE":
+            return _NONE
+        if token == "NULL":
+            return None
+        if token in ("true", "false"):
+            return token == "true"
+        if token.startswith("'") and token.endswith("'"):
+            return token[1:-1]
+        return int(token)
+    
+    def _where(self, table: str, where: Optional[str], params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """返回满足WHERE条件（以AND连接，括号内可用OR连接）的记录"""
+        rows = list(self._tables.get(table, {}).values())
+        if not where:
+            return rows
+        
+        for condition in where.split(" AND "):
+            alternatives = [
+                self._condition(alternative, params)
+                for alternative in condition.strip("()").split(" OR ")
+            ]
+            rows = [row for row in rows if any(matches(row) for matches in alternatives)]
+        return rows
+    
+    def _condition(self, condition: str, params: Dict[str, Any]):
+        """解析单个比较条件，返回判断记录是否满足条件的函数"""
+        field, op, token = _CONDITION_RE.match(condition).groups()
+        expected = self._value(token, params)
+        key = "id" if field == "meta::id(id)" else field
+        if expected is _NONE:
+            return lambda row: key not in row
+        if op in ("=", "IS"):
+            return lambda row: key in row and row[key] == expected
+        if op == "<":
+            return lambda row: row.get(key) is not None and row[key] < expected
+        return lambda row: row.get(key) in expected
+    
+    def _assign(self, rows: List[Dict[str, Any]], assignments: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """对记录执行SET赋值（+=向数组追加），返回更新后的记录"""
+        for assignment in assignments.split(", "):
+            field, op, token = _ASSIGNMENT_RE.match(assignment).groups()
+            value = self._value(token, params)
+            for row in rows:
+                if op == "+=":
+                    row[field] = list(row.get(field) or []) + (value if isinstance(value, list) else [value])
+                elif value is _NONE:
+                    row.pop(field, None)
+                else:
+                    row[field] = value
+        return [copy.deepcopy(row) for row in rows]
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    """整个测试会话共用一个事件循环，使会话级异步夹具可用（pytest-asyncio 0.21通过覆盖该夹具设置循环作用域）"""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest_asyncio.fixture(scope="session")
+async def setup_db():
+    """设置测试数据库连接（整个测试会话只连接一次）"""
+    # 使用基于字典的内存数据库进行测试
+    test_db = DictDatabase()
+    await test_db.connect()
+    yield test_db
+    # 断开连接
+    await test_db.disconnect()
+
+
+@pytest_asyncio.fixture
+async def clean_db(setup_db):
+    """提供共享的数据库连接，并在测试结束后清空测试表和存储库读缓存"""
+    yield setup_db
+    for table in TEST_TABLES:
+        await setup_db.delete_all(table)
+    clear_entity_cache(setup_db)
+
+
+@pytest_asyncio.fixture(scope="session")
+async def surreal_db():
+    """连接真实的SurrealDB测试实例（未设置SURREAL_TEST_URL或连接失败时跳过）"""
+    if not SURREAL_TEST_URL:
+        pytest.skip("未设置SURREAL_TEST_URL")
+    test_db = Database()
+    test_db.db_url = SURREAL_TEST_URL
+    test_db.db_database = SURREAL_TEST_DATABASE
+    if not await test_db.connect():
+        pytest.skip(f"无法连接SurrealDB: {SURREAL_TEST_URL}")
+    yield test_db
+    await test_db.disconnect()
+
+
+@pytest_asyncio.fixture
+async def clean_surreal_db(surreal_db):
+    """提供真实的SurrealDB连接，并在测试结束后清空测试表和存储库读缓存"""
+    yield surreal_db
+    for table in TEST_TABLES:
+        await surreal_db.delete_all(table)
+    clear_entity_cache(surreal_db)
+
+
+@pytest.fixture(params=["dict", "surreal"])
+def any_db(request):
+    """依次提供内存数据库和真实的SurrealDB（后者未配置时跳过），用于检查查询语义"""
+    return request.getfixturevalue("clean_db" if request.param == "dict" else "clean_surreal_db")
@@ -0,0 +1,61 @@
+"""
+计算器工具测试
+"""
+import pytest
+
+from app.tools.builtin.calculator_tool import CalculatorTool
+
+
+@pytest.fixture(scope="module")
+def calculator():
+    """计算器工具（无状态，模块内共享）"""
+    return CalculatorTool()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("expression, expected", [
+    pytest.param("1 + 2 * 3", "7", id="arithmetic"),
+    pytest.param("2 ^ 10", "1024", id="caret-pow"),
+    pytest.param("(2 ** 100) ** 3", str(2 ** 300), id="nested-pow"),
+    pytest.param("factorial(5)", "120", id="factorial"),
+    pytest.param("10 ** 4000", str(10 ** 4000), id="large-pow"),
+])
+async def test_calculator_evaluates(calculator, expression, expected):
+    """测试正常表达式求值"""
+    result = await calculator.execute({"expression": expression})
+    assert result.success is True
+    assert result.content == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("expression, error", [
+    pytest.param("9 ** 9 ** 9", "指数过大", id="huge-exponent"),
+    pytest.param("(10 ** 10000) ** 10000", "计算结果过大", id="nested-pow"),
+    pytest.param("factorial(10000) ** 10000", "计算结果过大", id="factorial-pow"),
+    pytest.param("factorial(100000)", "阶乘参数过大", id="huge-factorial"),
+    # 超过整数转字符串位数限制的结果
+    pytest.param("10 ** 5000", "计算结果过大", id="pow-digits"),
+    pytest.param("factorial(10000)", "计算结果过大", id="factorial-digits"),
+    pytest.param("10 ** 3000 * 10 ** 3000", "计算结果过大", id="product-digits"),
+    # 非实数和非有限结果
+    pytest.param("(-8) ** (1 / 3)", "计算结果不是实数", id="complex"),
+    pytest.param("1e308 * 10", "计算结果溢出或未定义", id="inf"),
+])
+async def test_calculator_rejects_oversized(calculator, expression, error):
+    """测试超大运算和无法作为实数返回的结果被拒绝"""
+    result = await calculator.execute({"expression": expression})
+    assert result.success is False
+    assert error in result.error
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("expression", [
+    pytest.param("__import__('os')", id="import"),
+    pytest.param("(1).__class__", id="attribute"),
+    pytest.param("'a' * 3", id="string"),
+])
+async def test_calculator_rejects_unsafe(calculator, expression):
+    """测试不允许的语法被拒绝"""
+    result = await calculator.execute({"expression": expression})
+    assert result.success is False
+    assert "无效的数学表达式" in result.error
@@ -3,52 +3,55 @@
 """
 import pytest
 import asyncio
+from datetime import datetime
 from typing import Dict, Any, List
 
-from app.db.database import Database, db
+from app.db.database import Database
 from app.db.repositories import (
-    BaseRepository,
     MessageRepository,
     TurnRepository,
     SessionRepository,
     DialogueRepository,
-    message_repo,
-    turn_repo,
-    session_repo,
-    dialogue_repo
+    clear_entity_cache
 )
 from app.models.data_models import Message, Turn, Session, Dialogue
 
 
-@pytest.fixture
-async def setup_db():
-    """设置测试数据库连接"""
-    # 使用内存数据库进行测试
-    test_db = Database(url="memory")
-    await test_db.connect()
-    yield test_db
-    # 清理数据库
-    await test_db.disconnect()
-
-
 @pytest.mark.asyncio
 async def test_database_connection():
     """测试数据库连接"""
-    # 使用内存数据库
-    test_db = Database(url="memory")
+    # 使用内存存储，不连接SurrealDB
+    test_db = Database()
+    test_db.db_url = "memory"
     
     # 连接数据库
     connected = await test_db.connect()
     assert connected is True
     
     # 断开连接
-    await test_db.disconnect()
+    disconnected = await test_db.disconnect()
+    assert disconnected is True
+
+
+@pytest.mark.asyncio
+async def test_database_memory_mode():
+    """测试内存模式下Database的基本操作（不连接SurrealDB，写入原样返回，查询为空）"""
+    test_db = Database()
+    test_db.db_url = "memory"
+    await test_db.connect()
+    
+    test_data = {"id": "test_id", "name": "test"}
+    assert await test_db.create("test", test_data) == test_data
+    assert await test_db.update("test", "test_id", test_data) == test_data
+    assert await test_db.select("test", "test_id") == []
+    assert await test_db.query("SELECT * FROM test") == []
+    assert await test_db.delete("test", "test_id") is True
 
 
 @pytest.mark.asyncio
-async def test_database_operations(setup_db):
+async def test_database_operations(any_db):
     """测试数据库基本操作"""
-    test_db = setup_db
+    test_db = any_db
     
     # 创建记录
     test_data = {"name": "test", "value": 123}
@@ -58,242 +61,195 @@ async def test_database_operations(setup_db):
     
     # 获取记录
     record_id = result["id"]
-    record = await test_db.select("test", record_id)
-    assert record is not None
-    assert record["name"] == "test"
-    assert record["value"] == 123
+    records = await test_db.select("test", record_id)
+    assert len(records) == 1
+    assert records[0]["name"] == "test"
+    assert records[0]["value"] == 123
     
     # 更新记录
     update_data = {"name": "updated", "value": 456}
     updated = await test_db.update("test", record_id, update_data)
-    assert updated is True
+    assert updated is not None
+    assert updated["id"] == record_id
     
     # 验证更新
-    updated_record = await test_db.select("test", record_id)
-    assert updated_record is not None
-    assert updated_record["name"] == "updated"
-    assert updated_record["value"] == 456
+    updated_records = await test_db.select("test", record_id)
+    assert len(updated_records) == 1
+    assert updated_records[0]["name"] == "updated"
+    assert updated_records[0]["value"] == 456
     
     # 删除记录
     deleted = await test_db.delete("test", record_id)
     assert deleted is True
     
     # 验证删除
-    deleted_record = await test_db.select("test", record_id)
-    assert deleted_record is None
+    deleted_records = await test_db.select("test", record_id)
+    assert deleted_records == []
 
 
-@pytest.mark.asyncio
-async def test_message_repository(setup_db):
-    """测试消息存储库"""
-    # 创建存储库
-    repo = MessageRepository(setup_db)
-    
-    # 创建消息
-    message = Message(
-        content="测试消息",
-        role="user",
-        content_type="text",
-        dialogue_id="test_dialogue",
-        session_id="test_session",
-        turn_id="test_turn"
-    )
-    
-    # 保存消息
-    created_message = await repo.create(message)
-    assert created_message is not None
-    assert created_message.id is not None
-    assert created_message.content == "测试消息"
-    
-    # 获取消息
-    retrieved_message = await repo.get(created_message.id)
-    assert retrieved_message is not None
-    assert retrieved_message.id == created_message.id
-    assert retrieved_message.content == "测试消息"
-    
-    # 更新消息
-    created_message.content = "更新的消息"
-    updated = await repo.update(created_message)
-    assert updated is True
-    
-    # 验证更新
-    updated_message = await repo.get(created_message.id)
-    assert updated_message is not None
-    assert updated_message.content == "更新的消息"
-    
-    # 获取会话消息
-    session_messages = await repo.get_by_session("test_session")
-    assert len(session_messages) == 1
-    assert session_messages[0].id == created_message.id
-    
-    # 获取轮次消息
-    turn_messages = await repo.get_by_turn("test_turn")
-    assert len(turn_messages) == 1
-    assert turn_messages[0].id == created_message.id
-    
-    # 删除消息
-    deleted = await repo.delete(created_message.id)
-    assert deleted is True
-    
-    # 验证删除
-    deleted_message = await repo.get(created_message.id)
-    assert deleted_message is None
+# 存储库测试用例：(存储库类, 模型构造函数, (更新字段, 更新值), [(列表查询方法, 参数), ...])
+REPO_CASES = [
+    pytest.param(
+        MessageRepository,
+        lambda: Message(
+            dialogue_id="test_dialogue",
+            session_id="test_session",
+            turn_id="test_turn",
+            sender_role="human",
+            content="测试消息",
+            content_type="text"
+        ),
+        ("content", "更新的消息"),
+        [("get_by_session", "test_session"), ("get_by_turn", "test_turn")],
+        id="message"
+    ),
+    pytest.param(
+        TurnRepository,
+        lambda: Turn(
+            dialogue_id="test_dialogue",
+            session_id="test_session",
+            initiator_role="human",
+            responder_role="ai",
+            metadata={"test": "metadata"}
+        ),
+        ("status", "responded"),
+        [("get_by_session", "test_session"), ("get_by_dialogue", "test_dialogue")],
+        id="turn"
+    ),
+    pytest.param(
+        SessionRepository,
+        lambda: Session(
+            dialogue_id="test_dialogue",
+            session_type="dialogue",
+            created_by="human",
+            metadata={"test": "metadata"}
+        ),
+        ("description", "更新的会话"),
+        [("get_by_dialogue", "test_dialogue")],
+        id="session"
+    ),
+    pytest.param(
+        DialogueRepository,
+        lambda: Dialogue(
+            dialogue_type="human_ai",
+            human_id="test_human",
+            ai_id="test_ai",
+            metadata={"test": "metadata"}
+        ),
+        ("title", "更新的对话"),
+        [("get_by_human", "test_human"), ("get_by_ai", "test_ai")],
+        id="dialogue"
+    ),
+]
 
 
 @pytest.mark.asyncio
-async def test_turn_repository(setup_db):
-    """测试轮次存储库"""
+@pytest.mark.parametrize("repo_cls, make_model, update, list_lookups", REPO_CASES)
+async def test_repository_crud(any_db, repo_cls, make_model, update, list_lookups):
+    """测试存储库的创建、获取、更新、列表查询和删除"""
     # 创建存储库
-    repo = TurnRepository(setup_db)
-    
-    # 创建轮次
-    turn = Turn(
-        session_id="test_session",
-        turn_index=1,
-        metadata={"test": "metadata"}
-    )
-    
-    # 保存轮次
-    created_turn = await repo.create(turn)
-    assert created_turn is not None
-    assert created_turn.id is not None
-    assert created_turn.session_id == "test_session"
-    assert created_turn.turn_index == 1
-    
-    # 获取轮次
-    retrieved_turn = await repo.get(created_turn.id)
-    assert retrieved_turn is not None
-    assert retrieved_turn.id == created_turn.id
-    assert retrieved_turn.session_id == "test_session"
-    
-    # 更新轮次
-    created_turn.metadata = {"updated": "metadata"}
-    updated = await repo.update(created_turn)
-    assert updated is True
+    repo = repo_cls(any_db)
+    model = make_model()
+    expected = model.dict(exclude={"id"})
+    
+    # 保存记录
+    created = await repo.create(model)
+    assert created is not None
+    assert created.id is not None
+    
+    # 获取记录（清空读缓存，从数据库读取）
+    clear_entity_cache(any_db)
+    retrieved = await repo.get(created.id)
+    assert retrieved is not None
+    assert retrieved.id == created.id
+    for field, value in expected.items():
+        assert getattr(retrieved, field) == value
     
-    # 验证更新
-    updated_turn = await repo.get(created_turn.id)
-    assert updated_turn is not None
-    assert updated_turn.metadata == {"updated": "metadata"}
+    # 更新记录
+    field, value = update
+    setattr(created, field, value)
+    updated = await repo.update(created)
+    assert updated is not None
+    
+    # 验证更新（清空读缓存，从数据库读取）
+    clear_entity_cache(any_db)
+    updated_record = await repo.get(created.id)
+    assert updated_record is not None
+    assert getattr(updated_record, field) == value
     
-    # 获取会话轮次
-    session_turns = await repo.get_by_session("test_session")
-    assert len(session_turns) == 1
-    assert session_turns[0].id == created_turn.id
+    # 并发执行列表查询
+    results = await asyncio.gather(*(getattr(repo, name)(arg) for name, arg in list_lookups))
+    for records in results:
+        assert len(records) == 1
+        assert records[0].id == created.id
     
-    # 删除轮次
-    deleted = await repo.delete(created_turn.id)
+    # 删除记录
+    deleted = await repo.delete(created.id)
     assert deleted is True
     
     # 验证删除
-    deleted_turn = await repo.get(created_turn.id)
-    assert deleted_turn is None
+    deleted_record = await repo.get(created.id)
+    assert deleted_record is None
 
 
 @pytest.mark.asyncio
-async def test_session_repository(setup_db):
-    """测试会话存储库"""
+async def test_message_bulk_create(any_db):
+    """测试批量创建消息"""
     # 创建存储库
-    repo = SessionRepository(setup_db)
-    
-    # 创建会话
-    session = Session(
-        dialogue_id="test_dialogue",
-        session_type="normal",
-        status="active",
-        metadata={"test": "metadata"}
-    )
-    
-    # 保存会话
-    created_session = await repo.create(session)
-    assert created_session is not None
-    assert created_session.id is not None
-    assert created_session.dialogue_id == "test_dialogue"
-    assert created_session.session_type == "normal"
-    
-    # 获取会话
-    retrieved_session = await repo.get(created_session.id)
-    assert retrieved_session is not None
-    assert retrieved_session.id == created_session.id
-    assert retrieved_session.dialogue_id == "test_dialogue"
-    
-    # 更新会话
-    created_session.status = "closed"
-    updated = await repo.update(created_session)
-    assert updated is True
-    
-    # 验证更新
-    updated_session = await repo.get(created_session.id)
-    assert updated_session is not None
-    assert updated_session.status == "closed"
-    
-    # 获取对话会话
-    dialogue_sessions = await repo.get_by_dialogue("test_dialogue")
-    assert len(dialogue_sessions) == 1
-    assert dialogue_sessions[0].id == created_session.id
-    
-    # 删除会话
-    deleted = await repo.delete(created_session.id)
-    assert deleted is True
-    
-    # 验证删除
-    deleted_session = await repo.get(created_session.id)
-    assert deleted_session is None
+    repo = MessageRepository(any_db)
+    
+    # 批量保存消息（一次往返）
+    messages = [
+        Message(
+            dialogue_id="test_dialogue",
+            session_id="test_session",
+            turn_id="test_turn",
+            sender_role="human",
+            content=f"批量消息{i}",
+            content_type="text"
+        )
+        for i in range(3)
+    ]
+    created_messages = await repo.bulk_create(messages)
+    assert len(created_messages) == 3
+    assert all(message.id is not None for message in created_messages)
+    
+    # 验证保存结果
+    session_messages = await repo.get_by_session("test_session")
+    assert len(session_messages) == 3
 
 
 @pytest.mark.asyncio
-async def test_dialogue_repository(setup_db):
-    """测试对话存储库"""
+async def test_close_open_sessions(any_db):
+    """测试结束对话下未结束的会话（end_at为NULL或NONE），已结束的会话和其他对话不受影响"""
     # 创建存储库
-    repo = DialogueRepository(setup_db)
-    
-    # 创建对话
-    dialogue = Dialogue(
-        dialogue_type="chat",
-        human_id="test_human",
-        ai_id="test_ai",
-        status="active",
-        metadata={"test": "metadata"}
-    )
-    
-    # 保存对话
-    created_dialogue = await repo.create(dialogue)
-    assert created_dialogue is not None
-    assert created_dialogue.id is not None
-    assert created_dialogue.dialogue_type == "chat"
-    assert created_dialogue.human_id == "test_human"
-    assert created_dialogue.ai_id == "test_ai"
-    
-    # 获取对话
-    retrieved_dialogue = await repo.get(created_dialogue.id)
-    assert retrieved_dialogue is not None
-    assert retrieved_dialogue.id == created_dialogue.id
-    assert retrieved_dialogue.dialogue_type == "chat"
-    
-    # 更新对话
-    created_dialogue.status = "closed"
-    updated = await repo.update(created_dialogue)
-    assert updated is True
-    
-    # 验证更新
-    updated_dialogue = await repo.get(created_dialogue.id)
-    assert updated_dialogue is not None
-    assert updated_dialogue.status == "closed"
-    
-    # 获取用户对话
-    human_dialogues = await repo.get_by_human("test_human")
-    assert len(human_dialogues) == 1
-    assert human_dialogues[0].id == created_dialogue.id
-    
-    # 获取AI对话
-    ai_dialogues = await repo.get_by_ai("test_ai")
-    assert len(ai_dialogues) == 1
-    assert ai_dialogues[0].id == created_dialogue.id
-    
-    # 删除对话
-    deleted = await repo.delete(created_dialogue.id)
-    assert deleted is True
-    
-    # 验证删除
-    deleted_dialogue = await repo.get(created_dialogue.id)
-    assert deleted_dialogue is None
+    repo = SessionRepository(any_db)
+    
+    def make_session(dialogue_id: str, **kwargs) -> Session:
+        return Session(dialogue_id=dialogue_id, session_type="dialogue", created_by="human", **kwargs)
+    
+    # end_at为NULL（Session.dict()写入None）
+    null_session = await repo.create(make_session("test_dialogue"))
+    # end_at为NONE（记录中没有该字段）
+    none_data = make_session("test_dialogue").dict(exclude={"end_at"})
+    none_session_id = (await any_db.create("session", none_data))["id"]
+    # 已结束的会话和其他对话的会话
+    ended_at = datetime(2024, 1, 1)
+    ended_session = await repo.create(make_session("test_dialogue", end_at=ended_at))
+    other_session = await repo.create(make_session("other_dialogue"))
+    
+    # 未结束的会话均为活跃会话
+    active_ids = {session.id for session in await repo.get_active_sessions()}
+    assert active_ids == {null_session.id, none_session_id, other_session.id}
+    
+    # 结束对话下的会话
+    closed_at = datetime(2024, 6, 1)
+    assert await repo.close_open_sessions("test_dialogue", closed_at) is True
+    
+    # 验证只有该对话下未结束的会话被结束
+    assert (await repo.get(null_session.id)).end_at == closed_at
+    assert (await repo.get(none_session_id)).end_at == closed_at
+    assert (await repo.get(ended_session.id)).end_at == ended_at
+    assert (await repo.get(other_session.id)).end_at is None
+    active_ids = {session.id for session in await repo.get_active_sessions()}
+    assert active_ids == {other_session.id}
@@ -2,43 +2,70 @@
 对话服务测试
 """
 import pytest
+import pytest_asyncio
 import asyncio
-from typing import Dict, Any
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
 
-from app.db.database import db
-from app.db.repositories import dialogue_repo, session_repo, turn_repo, message_repo
-from app.services.dialogue_service import DialogueService, dialogue_service
-from app.models.data_models import Message, Dialogue, Session, Turn
+from app.core.constants import DialogueTypes
+from app.db.repositories import message_repo, turn_repo, session_repo, dialogue_repo
+from app.services.dialogue_service import DialogueService
+from app.models.data_models import Message
 
+# 模拟对话核心返回的处理结果
+MOCK_PROCESS_RESULT = {
+    "ai_id": "test_ai",
+    "content": "这是一个测试响应",
+    "content_type": "text",
+    "metadata": {"model": "mock"}
+}
 
-@pytest.fixture
-async def setup_db():
-    """设置测试数据库连接"""
-    # 使用内存数据库进行测试
-    db.url = "memory"
-    await db.connect()
+
+@pytest.fixture(scope="module")
+def dialogue_service_instance(setup_db):
+    """创建对话服务实例（模块内共用，全局存储库在模块内指向测试数据库）"""
+    with pytest.MonkeyPatch.context() as mp:
+        for repo in (message_repo, turn_repo, session_repo, dialogue_repo):
+            mp.setattr(repo, "db", setup_db)
+        yield DialogueService()
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def reset_dialogue_service(dialogue_service_instance, clean_db):
+    """每个测试结束后重置共用的对话服务（先于clean_db清表执行，确保后台写入已完成）"""
     yield
-    # 清理数据库
-    await db.disconnect()
-
-
-@pytest.fixture
-def dialogue_service_instance():
-    """创建对话服务实例"""
-    return DialogueService(
-        dialogue_repo=dialogue_repo,
-        session_repo=session_repo,
-        turn_repo=turn_repo,
-        message_repo=message_repo
+    await dialogue_service_instance.shutdown()
+    dialogue_service_instance._pending_writes.clear()
+    dialogue_service_instance._turn_mono_start.clear()
+
+
+async def _create_turn(service: DialogueService):
+    """创建测试用的对话、会话和轮次"""
+    dialogue = await service.create_dialogue(
+        dialogue_type=DialogueTypes.HUMAN_AI,
+        human_id="test_human",
+        ai_id="test_ai"
     )
+    session = await service.create_session(
+        dialogue_id=dialogue.id,
+        session_type="dialogue",
+        created_by="human"
+    )
+    turn = await service.create_turn(
+        dialogue_id=dialogue.id,
+        session_id=session.id,
+        initiator_role="human",
+        responder_role="ai"
+    )
+    return dialogue, session, turn
 
 
 @pytest.mark.asyncio
-async def test_create_dialogue(setup_db, dialogue_service_instance):
+async def test_create_dialogue(dialogue_service_instance):
     """测试创建对话"""
     # 创建对话
     dialogue = await dialogue_service_instance.create_dialogue(
-        dialogue_type="chat",
+        dialogue_type=DialogueTypes.HUMAN_AI,
         human_id="test_human",
         ai_id="test_ai",
         metadata={"test": "metadata"}
@@ -47,11 +74,11 @@ async def test_create_dialogue(setup_db, dialogue_service_instance):
     # 验证对话
     assert dialogue is not None
     assert dialogue.id is not None
-    assert dialogue.dialogue_type == "chat"
+    assert dialogue.dialogue_type == DialogueTypes.HUMAN_AI
     assert dialogue.human_id == "test_human"
     assert dialogue.ai_id == "test_ai"
     assert dialogue.metadata == {"test": "metadata"}
-    assert dialogue.status == "active"
+    assert dialogue.is_active is True
     
     # 从数据库获取对话
     db_dialogue = await dialogue_repo.get(dialogue.id)
@@ -60,18 +87,20 @@ async def test_create_dialogue(setup_db, dialogue_service_instance):
 
 
 @pytest.mark.asyncio
-async def test_create_session(setup_db, dialogue_service_instance):
+async def test_create_session(dialogue_service_instance):
     """测试创建会话"""
     # 创建对话
     dialogue = await dialogue_service_instance.create_dialogue(
-        dialogue_type="chat",
-        human_id="test_human"
+        dialogue_type=DialogueTypes.HUMAN_AI,
+        human_id="test_human",
+        ai_id="test_ai"
     )
     
     # 创建会话
     session = await dialogue_service_instance.create_session(
         dialogue_id=dialogue.id,
-        session_type="normal",
+        session_type="dialogue",
+        created_by="human",
         metadata={"test": "session"}
     )
     
@@ -79,132 +108,155 @@ async def test_create_session(setup_db, dialogue_service_instance):
     assert session is not None
     assert session.id is not None
     assert session.dialogue_id == dialogue.id
-    assert session.session_type == "normal"
+    assert session.session_type == "dialogue"
+    assert session.created_by == "human"
     assert session.metadata == {"test": "session"}
-    assert session.status == "active"
+    assert session.end_at is None
     
-    # 从数据库获取会话
+    # 从数据库获取会话，并验证已追加到对话
     db_session = await session_repo.get(session.id)
     assert db_session is not None
     assert db_session.id == session.id
+    db_dialogue = await dialogue_repo.get(dialogue.id)
+    assert session.id in db_dialogue.sessions
 
 
 @pytest.mark.asyncio
-async def test_create_turn(setup_db, dialogue_service_instance):
+async def test_create_turn(dialogue_service_instance):
     """测试创建轮次"""
-    # 创建对话和会话
-    dialogue = await dialogue_service_instance.create_dialogue(dialogue_type="chat")
-    session = await dialogue_service_instance.create_session(dialogue_id=dialogue.id)
-    
-    # 创建轮次
-    turn = await dialogue_service_instance.create_turn(
-        session_id=session.id,
-        turn_index=1,
-        metadata={"test": "turn"}
-    )
+    # 创建对话、会话和轮次
+    dialogue, session, turn = await _create_turn(dialogue_service_instance)
     
     # 验证轮次
     assert turn is not None
     assert turn.id is not None
+    assert turn.dialogue_id == dialogue.id
     assert turn.session_id == session.id
-    assert turn.turn_index == 1
-    assert turn.metadata == {"test": "turn"}
+    assert turn.initiator_role == "human"
+    assert turn.responder_role == "ai"
+    assert turn.status == "open"
     
-    # 从数据库获取轮次
+    # 从数据库获取轮次，并验证已追加到会话
     db_turn = await turn_repo.get(turn.id)
     assert db_turn is not None
     assert db_turn.id == turn.id
+    db_session = await session_repo.get(session.id)
+    assert turn.id in db_session.turns
 
 
 @pytest.mark.asyncio
-async def test_process_message(setup_db, dialogue_service_instance, monkeypatch):
+async def test_process_message(dialogue_service_instance, monkeypatch):
     """测试处理消息"""
-    # 模拟对话核心处理
-    async def mock_process_message(*args, **kwargs):
-        # 创建响应消息
-        response_message = Message(
-            content="这是一个测试响应",
-            role="assistant",
-            content_type="text"
-        )
-        
-        # 返回处理结果
-        return {
-            "dialogue": kwargs.get("dialogue") or Dialogue(dialogue_type="chat"),
-            "session": kwargs.get("session") or Session(dialogue_id="test_dialogue"),
-            "turn": kwargs.get("turn") or Turn(session_id="test_session"),
-            "response_message": response_message
-        }
-    
-    # 应用模拟
-    from app.core.dialogue_core import dialogue_core
-    monkeypatch.setattr(dialogue_core, "process_message", mock_process_message)
+    # 模拟对话核心（在类上替换cached_property，避免创建真实的DialogueCore）
+    mock_core = SimpleNamespace(process_message=AsyncMock(return_value=MOCK_PROCESS_RESULT))
+    monkeypatch.setattr(DialogueService, "dialogue_core", mock_core)
+    
+    dialogue, session, turn = await _create_turn(dialogue_service_instance)
     
     # 创建输入消息
     input_message = Message(
+        dialogue_id=dialogue.id,
+        session_id=session.id,
+        turn_id=turn.id,
+        sender_role="human",
+        sender_id="test_human",
         content="这是一个测试消息",
-        role="user",
         content_type="text"
     )
     
     # 处理消息
-    result = await dialogue_service_instance.process_message(input_message)
+    result = await dialogue_service_instance.process_message(input_message, stream=False)
     
     # 验证结果
-    assert result is not None
-    assert "dialogue" in result
-    assert "session" in result
-    assert "turn" in result
-    assert "response_message" in result
-    assert result["response_message"].content == "这是一个测试响应"
-    assert result["response_message"].role == "assistant"
+    assert result["success"] is True
+    assert result["message_id"]
+    assert result["content"] == "这是一个测试响应"
+    assert result["content_type"] == "text"
+    assert result["metadata"] == {"model": "mock"}
+    mock_core.process_message.assert_awaited_once()
+    
+    # 等待后台写入完成后验证响应消息和轮次状态
+    await dialogue_service_instance.shutdown()
+    response_message = await message_repo.get(result["message_id"])
+    assert response_message is not None
+    assert response_message.sender_role == "ai"
+    assert response_message.sender_id == "test_ai"
+    db_turn = await turn_repo.get(turn.id)
+    assert db_turn.status == "responded"
+    assert result["message_id"] in db_turn.messages
 
 
 @pytest.mark.asyncio
-async def test_get_dialogue_history(setup_db, dialogue_service_instance):
-    """测试获取对话历史"""
-    # 创建对话和会话
-    dialogue = await dialogue_service_instance.create_dialogue(dialogue_type="chat")
-    session = await dialogue_service_instance.create_session(dialogue_id=dialogue.id)
-    turn = await dialogue_service_instance.create_turn(session_id=session.id)
+async def test_process_message_persist_failure(dialogue_service_instance, monkeypatch):
+    """测试响应消息写库失败时轮次保持打开，不指向不存在的消息"""
+    mock_core = SimpleNamespace(process_message=AsyncMock(return_value=MOCK_PROCESS_RESULT))
+    monkeypatch.setattr(DialogueService, "dialogue_core", mock_core)
     
-    # 创建消息
-    message1 = Message(
-        dialogue_id=dialogue.id,
-        session_id=session.id,
-        turn_id=turn.id,
-        content="用户消息",
-        role="user",
-        content_type="text"
-    )
-    message2 = Message(
+    dialogue, session, turn = await _create_turn(dialogue_service_instance)
+    
+    # 模拟响应消息写库失败
+    monkeypatch.setattr(message_repo, "create", AsyncMock(return_value=None))
+    
+    input_message = Message(
         dialogue_id=dialogue.id,
         session_id=session.id,
         turn_id=turn.id,
-        content="AI响应",
-        role="assistant",
+        sender_role="human",
+        sender_id="test_human",
+        content="这是一个测试消息",
         content_type="text"
     )
+    await dialogue_service_instance.process_message(input_message, stream=False)
     
-    # 保存消息
-    await message_repo.create(message1)
-    await message_repo.create(message2)
+    # 等待后台任务完成后验证轮次未关闭
+    await dialogue_service_instance.shutdown()
+    db_turn = await turn_repo.get(turn.id)
+    assert db_turn.status == "open"
+    assert db_turn.messages == []
+
+
+@pytest.mark.asyncio
+async def test_get_dialogue_history(dialogue_service_instance):
+    """测试获取对话历史"""
+    # 创建对话、会话和轮次
+    dialogue, session, turn = await _create_turn(dialogue_service_instance)
+    
+    # 并发创建消息
+    await asyncio.gather(
+        dialogue_service_instance.create_message(
+            dialogue_id=dialogue.id,
+            session_id=session.id,
+            turn_id=turn.id,
+            sender_role="human",
+            sender_id="test_human",
+            content="用户消息",
+            content_type="text"
+        ),
+        dialogue_service_instance.create_message(
+            dialogue_id=dialogue.id,
+            session_id=session.id,
+            turn_id=turn.id,
+            sender_role="ai",
+            sender_id="test_ai",
+            content="AI响应",
+            content_type="text"
+        )
+    )
     
     # 获取对话历史
     messages = await dialogue_service_instance.get_dialogue_history(dialogue.id)
     
     # 验证历史
-    assert messages is not None
     assert len(messages) == 2
     assert any(m.content == "用户消息" for m in messages)
     assert any(m.content == "AI响应" for m in messages)
 
 
 @pytest.mark.asyncio
-async def test_close_dialogue(setup_db, dialogue_service_instance):
+async def test_close_dialogue(dialogue_service_instance):
     """测试关闭对话"""
-    # 创建对话
-    dialogue = await dialogue_service_instance.create_dialogue(dialogue_type="chat")
+    # 创建对话和会话
+    dialogue, session, _ = await _create_turn(dialogue_service_instance)
     
     # 关闭对话
     success = await dialogue_service_instance.close_dialogue(dialogue.id)
@@ -212,7 +264,9 @@ async def test_close_dialogue(setup_db, dialogue_service_instance):
     # 验证关闭结果
     assert success is True
     
-    # 获取对话并验证状态
+    # 获取对话和会话并验证状态
     closed_dialogue = await dialogue_repo.get(dialogue.id)
     assert closed_dialogue is not None
-    assert closed_dialogue.status == "closed"
+    assert closed_dialogue.is_active is False
+    closed_session = await session_repo.get(session.id)
+    assert closed_session.end_at is not None
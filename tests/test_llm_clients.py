@@ -2,22 +2,37 @@
 LLM客户端测试
 """
 import pytest
-import asyncio
-import json
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
+from app.core import llm_clients
 from app.core.llm_clients import (
     BaseLLMClient,
     MockLLMClient,
-    OpenAILLMClient,
-    AzureLLMClient,
+    OpenAIClient,
+    AzureOpenAIClient,
     get_llm_client
 )
 
+# 测试使用的LLM配置
+TEST_LLM_CONFIG = {
+    "provider": "mock",
+    "api_key": "test_key",
+    "api_url": "https://test-endpoint.example.com",
+    "model": "gpt-3.5-turbo"
+}
+
 
 @pytest.fixture
+def llm_config(monkeypatch):
+    """替换客户端读取的LLM配置（返回可按测试修改的副本）"""
+    config = dict(TEST_LLM_CONFIG)
+    monkeypatch.setattr(llm_clients, "get_config", lambda: {"llm": config})
+    return config
+
+
+@pytest.fixture(scope="module")
 def mock_response():
-    """模拟LLM响应"""
+    """模拟LLM响应（模块内共享，测试不修改）"""
     return {
         "id": "test-response-id",
         "object": "chat.completion",
@@ -41,115 +56,105 @@ def mock_response():
     }
 
 
+@pytest.fixture(scope="module")
+def mock_session(mock_response):
+    """模拟HTTP会话（模块内共享，注入客户端代替真实会话，无需逐个测试patch aiohttp）"""
+    session = MagicMock()
+    response = AsyncMock(status=200)
+    response.json = AsyncMock(return_value=mock_response)
+    session.post.return_value.__aenter__.return_value = response
+    return session
+
+
+@pytest.fixture
+def llm_session(mock_session):
+    """每个测试使用前清空共享会话的调用记录（保留模拟响应）"""
+    mock_session.post.reset_mock()
+    return mock_session
+
+
 @pytest.mark.asyncio
-async def test_mock_llm_client():
+async def test_mock_llm_client(llm_config):
     """测试模拟LLM客户端"""
     # 创建客户端
     client = MockLLMClient()
     
-    # 发送消息
-    response = await client.send_message(
-        messages=[{"role": "user", "content": "测试消息"}],
-        model="gpt-3.5-turbo"
-    )
+    # 生成响应
+    response = await client.generate("明天天气怎么样")
     
     # 验证响应
-    assert response is not None
-    assert "content" in response
-    assert "role" in response
-    assert response["role"] == "assistant"
+    assert "error" not in response
     assert isinstance(response["content"], str)
+    assert "天气" in response["content"]
 
 
 @pytest.mark.asyncio
-async def test_openai_llm_client(mock_response):
+async def test_openai_llm_client(llm_config, llm_session):
     """测试OpenAI LLM客户端"""
-    # 模拟aiohttp.ClientSession.post
-    with patch("aiohttp.ClientSession.post") as mock_post:
-        # 设置模拟响应
-        mock_context = MagicMock()
-        mock_context.__aenter__.return_value.status = 200
-        mock_context.__aenter__.return_value.json = MagicMock(
-            return_value=asyncio.Future()
-        )
-        mock_context.__aenter__.return_value.json.return_value.set_result(mock_response)
-        mock_post.return_value = mock_context
-        
-        # 创建客户端
-        client = OpenAILLMClient(api_key="test_key")
-        
-        # 发送消息
-        response = await client.send_message(
-            messages=[{"role": "user", "content": "测试消息"}],
-            model="gpt-3.5-turbo"
-        )
-        
-        # 验证响应
-        assert response is not None
-        assert response["role"] == "assistant"
-        assert response["content"] == "这是一个测试响应"
-        
-        # 验证调用
-        mock_post.assert_called_once()
-        args, kwargs = mock_post.call_args
-        assert kwargs["url"] == "https://api.openai.com/v1/chat/completions"
-        assert kwargs["headers"]["Authorization"] == "Bearer test_key"
-        assert json.loads(kwargs["json"]["messages"][0]["content"]) == "测试消息"
+    # 创建客户端（注入HTTP会话）
+    client = OpenAIClient(session=llm_session)
+    
+    # 生成响应
+    prompt = "测试消息"
+    response = await client.generate(prompt)
+    
+    # 验证响应
+    assert "error" not in response
+    assert response["id"] == "test-response-id"
+    assert response["content"] == "这是一个测试响应"
+    assert response["usage"]["total_tokens"] == 30
+    
+    # 验证调用
+    llm_session.post.assert_called_once()
+    args, kwargs = llm_session.post.call_args
+    assert args[0] == "https://test-endpoint.example.com/chat/completions"
+    assert kwargs["headers"]["Authorization"] == "Bearer test_key"
+    assert kwargs["json"]["model"] == "gpt-3.5-turbo"
+    assert kwargs["json"]["messages"][1]["content"] == prompt
 
 
 @pytest.mark.asyncio
-async def test_azure_llm_client(mock_response):
+async def test_azure_llm_client(llm_config, llm_session):
     """测试Azure LLM客户端"""
-    # 模拟aiohttp.ClientSession.post
-    with patch("aiohttp.ClientSession.post") as mock_post:
-        # 设置模拟响应
-        mock_context = MagicMock()
-        mock_context.__aenter__.return_value.status = 200
-        mock_context.__aenter__.return_value.json = MagicMock(
-            return_value=asyncio.Future()
-        )
-        mock_context.__aenter__.return_value.json.return_value.set_result(mock_response)
-        mock_post.return_value = mock_context
-        
-        # 创建客户端
-        client = AzureLLMClient(
-            api_key="test_key",
-            api_url="https://test-azure-endpoint.openai.azure.com"
-        )
-        
-        # 发送消息
-        response = await client.send_message(
-            messages=[{"role": "user", "content": "测试消息"}],
-            model="gpt-3.5-turbo"
-        )
-        
-        # 验证响应
-        assert response is not None
-        assert response["role"] == "assistant"
-        assert response["content"] == "这是一个测试响应"
-        
-        # 验证调用
-        mock_post.assert_called_once()
-        args, kwargs = mock_post.call_args
-        assert "https://test-azure-endpoint.openai.azure.com" in kwargs["url"]
-        assert kwargs["headers"]["api-key"] == "test_key"
-        assert json.loads(kwargs["json"]["messages"][0]["content"]) == "测试消息"
-
-
-def test_get_llm_client():
-    """测试获取LLM客户端"""
-    # 测试获取模拟客户端
-    client = get_llm_client("mock")
-    assert isinstance(client, MockLLMClient)
+    # 创建客户端（注入HTTP会话）
+    llm_config["api_url"] = "https://test-azure-endpoint.openai.azure.com"
+    client = AzureOpenAIClient(session=llm_session)
     
-    # 测试获取OpenAI客户端
-    client = get_llm_client("openai", api_key="test_key")
-    assert isinstance(client, OpenAILLMClient)
+    # 生成响应
+    prompt = "测试消息"
+    response = await client.generate(prompt)
     
-    # 测试获取Azure客户端
-    client = get_llm_client("azure", api_key="test_key", api_url="test_url")
-    assert isinstance(client, AzureLLMClient)
+    # 验证响应
+    assert "error" not in response
+    assert response["content"] == "这是一个测试响应"
     
-    # 测试获取未知客户端（应返回模拟客户端）
-    client = get_llm_client("unknown")
-    assert isinstance(client, MockLLMClient)
+    # 验证调用
+    llm_session.post.assert_called_once()
+    args, kwargs = llm_session.post.call_args
+    assert args[0].startswith(
+        "https://test-azure-endpoint.openai.azure.com/openai/deployments/gpt-3.5-turbo/chat/completions"
+    )
+    assert kwargs["headers"]["api-key"] == "test_key"
+    assert kwargs["json"]["messages"][1]["content"] == prompt
+
+
+def test_azure_llm_client_requires_api_url(llm_config):
+    """测试Azure客户端未配置API地址时报错"""
+    llm_config["api_url"] = ""
+    with pytest.raises(ValueError):
+        AzureOpenAIClient()
+
+
+@pytest.mark.parametrize("provider, expected_cls", [
+    pytest.param("mock", MockLLMClient, id="mock"),
+    pytest.param("openai", OpenAIClient, id="openai"),
+    pytest.param("azure", AzureOpenAIClient, id="azure"),
+    # 未知提供商应返回模拟客户端
+    pytest.param("unknown", MockLLMClient, id="unknown"),
+])
+def test_get_llm_client(llm_config, provider, expected_cls):
+    """测试按配置的提供商获取LLM客户端"""
+    llm_config["provider"] = provider
+    client = get_llm_client()
+    assert isinstance(client, BaseLLMClient)
+    assert type(client) is expected_cls
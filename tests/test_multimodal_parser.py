@@ -4,10 +4,12 @@
 import sys
 import os
 import asyncio
-import json
 from datetime import datetime
 from pathlib import Path
 
+import orjson
+import pytest
+
 # 添加项目根目录到Python路径
 sys.path.append(str(Path(__file__).parent.parent))
 
@@ -17,10 +19,40 @@ from app.core.multimodal_input_parser import (
     ContentType
 )
 
-async def test_text_parser():
+
+# 测试消息共用的创建时间（断言不依赖时间戳）
+NOW_ISO = datetime.now().isoformat()
+
+# 设置环境变量VERBOSE_TESTS时打印各解析结果
+VERBOSE = bool(os.environ.get("VERBOSE_TESTS"))
+
+# 工具输出消息内容（解析器直接接受字典，无需先序列化为JSON字符串）
+_TOOL_PAYLOAD = {
+    "tool": "weather",
+    "result": {
+        "city": "北京",
+        "temp": 25,
+        "condition": "晴朗"
+    }
+}
+
+
+def _report(title: str, result) -> None:
+    """在详细模式下打印解析结果"""
+    if VERBOSE:
+        print(f"\n=== {title} ===")
+        print(orjson.dumps(result, default=str, option=orjson.OPT_INDENT_2).decode())
+
+
+@pytest.fixture(scope="module")
+def parser():
+    """多模态输入解析器（模块内共享，各测试只调用解析方法）"""
+    return MultiModalInputParser()
+
+
+@pytest.mark.asyncio
+async def test_text_parser(parser):
     """测试文本解析器"""
-    parser = MultiModalInputParser()
-    
     # 创建文本消息
     message = Message(
         message_id="test-message-1",
@@ -29,22 +61,25 @@ async def test_text_parser():
         sender_role="human",
         content_type=ContentType.TEXT.value,
         content="我今天感觉很开心，因为天气很好，我计划去旅行。",
-        created_at=datetime.now().isoformat()
+        created_at=NOW_ISO
     )
     
     # 解析消息
     result = await parser.parse(message)
     
     # 打印结果
-    print("\n=== 文本解析结果 ===")
-    print(json.dumps(result, ensure_ascii=False, indent=2))
+    _report("文本解析结果", result)
     
-    return result
+    assert result["text_block"] == message.content
+    assert result["summary"] == message.content
+    assert result["semantic_tags"] == ["天气", "旅行"]
+    assert result["emotions"] == ["positive"]
+    assert result["source_message_id"] == "test-message-1"
+    assert result["origin"] == "human"
 
-async def test_image_parser():
+@pytest.mark.asyncio
+async def test_image_parser(parser):
     """测试图像解析器"""
-    parser = MultiModalInputParser()
-    
     # 创建图像消息
     message = Message(
         message_id="test-message-2",
@@ -59,22 +94,25 @@ async def test_image_parser():
             "height": 600,
             "format": "jpg"
         },
-        created_at=datetime.now().isoformat()
+        created_at=NOW_ISO
     )
     
     # 解析消息
     result = await parser.parse(message)
     
     # 打印结果
-    print("\n=== 图像解析结果 ===")
-    print(json.dumps(result, ensure_ascii=False, indent=2))
+    _report("图像解析结果", result)
     
-    return result
+    assert result["text_block"] == "图片：一张美丽的风景照"
+    assert result["image_url"] == "http://example.com/test-image.jpg"
+    assert result["caption"] == "一张美丽的风景照"
+    assert result["semantic_tags"] == ["自然"]
+    assert result["emotions"] == ["positive"]
+    assert result["summary"] == "一张美丽的风景照。主题：自然。"
 
-async def test_audio_parser():
+@pytest.mark.asyncio
+async def test_audio_parser(parser):
     """测试音频解析器"""
-    parser = MultiModalInputParser()
-    
     # 创建音频消息
     message = Message(
         message_id="test-message-3",
@@ -88,22 +126,25 @@ async def test_audio_parser():
             "format": "mp3",
             "transcription": "这是一段测试音频的转录文本，包含了一些情感表达。"
         },
-        created_at=datetime.now().isoformat()
+        created_at=NOW_ISO
     )
     
     # 解析消息
     result = await parser.parse(message)
     
     # 打印结果
-    print("\n=== 音频解析结果 ===")
-    print(json.dumps(result, ensure_ascii=False, indent=2))
+    _report("音频解析结果", result)
     
-    return result
+    transcription = message.content_meta["transcription"]
+    assert result["text_block"] == transcription
+    assert result["transcription"] == transcription
+    assert result["audio_url"] == "http://example.com/test-audio.mp3"
+    assert result["emotions"] == ["neutral"]
+    assert "timeline_summary" in result
 
-async def test_tool_output_parser():
+@pytest.mark.asyncio
+async def test_tool_output_parser(parser):
     """测试工具输出解析器"""
-    parser = MultiModalInputParser()
-    
     # 创建工具输出消息
     message = Message(
         message_id="test-message-4",
@@ -111,30 +152,30 @@ async def test_tool_output_parser():
         turn_id="test-turn-1",
         sender_role="system",
         content_type=ContentType.TOOL_OUTPUT.value,
-        content=json.dumps({
-            "tool": "weather",
-            "result": {
-                "city": "北京",
-                "temp": 25,
-                "condition": "晴朗"
-            }
-        }),
-        created_at=datetime.now().isoformat()
+        content=_TOOL_PAYLOAD,
+        created_at=NOW_ISO
     )
     
     # 解析消息
     result = await parser.parse(message)
     
     # 打印结果
-    print("\n=== 工具输出解析结果 ===")
-    print(json.dumps(result, ensure_ascii=False, indent=2))
+    _report("工具输出解析结果", result)
     
-    return result
+    assert result["tool_type"] == "weather"
+    assert result["semantic_tags"] == ["weather"]
+    assert result["tool_result"] == _TOOL_PAYLOAD["result"]
+    assert result["text_block"] == "天气查询结果：北京的天气是晴朗，温度25度，无雨。"
+    assert result["key_info"] == {
+        "city": "北京",
+        "temperature": 25,
+        "condition": "晴朗",
+        "has_rain": False
+    }
 
-async def test_mixed_content():
+@pytest.mark.asyncio
+async def test_mixed_content(parser):
     """测试混合内容解析"""
-    parser = MultiModalInputParser()
-    
     # 创建多个不同类型的消息
     messages = [
         Message(
@@ -144,7 +185,7 @@ async def test_mixed_content():
             sender_role="human",
             content_type=ContentType.TEXT.value,
             content="这是我今天拍的照片，天气很好。",
-            created_at=datetime.now().isoformat()
+            created_at=NOW_ISO
         ),
         Message(
             message_id="test-message-5-2",
@@ -159,7 +200,7 @@ async def test_mixed_content():
                 "height": 800,
                 "format": "jpg"
             },
-            created_at=datetime.now().isoformat()
+            created_at=NOW_ISO
         ),
         Message(
             message_id="test-message-5-3",
@@ -173,7 +214,7 @@ async def test_mixed_content():
                 "format": "mp3",
                 "transcription": "这是我在公园录制的鸟叫声，非常悦耳。"
             },
-            created_at=datetime.now().isoformat()
+            created_at=NOW_ISO
         )
     ]
     
@@ -181,15 +222,20 @@ async def test_mixed_content():
     result = await parser.parse_mixed_content(messages)
     
     # 打印结果
-    print("\n=== 混合内容解析结果 ===")
-    print(json.dumps(result, ensure_ascii=False, indent=2))
+    _report("混合内容解析结果", result)
     
-    return result
+    assert result["modalities"] == ["text", "image", "audio"]
+    assert len(result["original_results"]) == 3
+    assert result["text_block"].split("\n\n") == [
+        "这是我今天拍的照片，天气很好。",
+        "图片：阳光明媚的公园",
+        "这是我在公园录制的鸟叫声，非常悦耳。"
+    ]
+    assert set(result["semantic_tags"]) == {"天气", "其他"}
 
-async def test_quote_reply_resolver():
+@pytest.mark.asyncio
+async def test_quote_reply_resolver(parser):
     """测试引用回复解析器"""
-    parser = MultiModalInputParser()
-    
     # 创建引用回复消息
     message = Message(
         message_id="test-message-6",
@@ -203,59 +249,72 @@ async def test_quote_reply_resolver():
             "quoted_content": "我认为这个方案很好",
             "quoted_sender": "ai"
         },
-        created_at=datetime.now().isoformat()
+        created_at=NOW_ISO
     )
     
     # 解析消息
     result = await parser.parse(message)
     
     # 打印结果
-    print("\n=== 引用回复解析结果 ===")
-    print(json.dumps(result, ensure_ascii=False, indent=2))
+    _report("引用回复解析结果", result)
     
-    return result
+    # 未配置消息服务时无法取回被引用的消息，使用占位内容
+    assert result["reply_to_id"] == "original-message-id"
+    assert result["original_text"] == "我同意你的观点"
+    assert result["quoted_content"] == "引用的消息内容不可用"
+    assert result["quoted_sender"] == "unknown"
+    assert result["text_block"] == '引用："引用的消息内容不可用"\n\n我同意你的观点'
 
-async def test_system_prompt_parser():
+@pytest.mark.asyncio
+async def test_system_prompt_parser(parser):
     """测试系统提示解析器"""
-    parser = MultiModalInputParser()
-    
     # 创建系统提示消息
     message = Message(
         message_id="test-message-7",
         dialogue_id="test-dialogue-1",
         turn_id="test-turn-1",
         sender_role="system",
-        content_type=ContentType.SYSTEM_PROMPT.value,
+        content_type=ContentType.PROMPT.value,
         content="请以专业的语气回答用户的问题",
         content_meta={
             "type": "system_instruction",
             "priority": "high"
         },
-        created_at=datetime.now().isoformat()
+        created_at=NOW_ISO
     )
     
     # 解析消息
     result = await parser.parse(message)
     
     # 打印结果
-    print("\n=== 系统提示解析结果 ===")
-    print(json.dumps(result, ensure_ascii=False, indent=2))
+    _report("系统提示解析结果", result)
     
-    return result
+    assert result["prompt_type"] == "system_instruction"
+    assert result["prompt_text"] == "请以专业的语气回答用户的问题"
+    assert result["text_block"] == "系统指令: 请以专业的语气回答用户的问题"
+    assert result["instruction_intent"] == "request_response"
 
 async def run_all_tests():
-    """运行所有测试"""
-    print("开始测试多模态输入解析器...")
+    """直接运行本文件时执行所有测试（pytest会单独收集各测试）"""
+    if VERBOSE:
+        print("开始测试多模态输入解析器...")
     
-    await test_text_parser()
-    await test_image_parser()
-    await test_audio_parser()
-    await test_tool_output_parser()
-    await test_mixed_content()
-    await test_quote_reply_resolver()
-    await test_system_prompt_parser()
+    parser = MultiModalInputParser()
+    
+    # 各测试解析互不相关的消息，并发执行
+    # 每个测试的结果在解析完成后一次性打印，输出块不会交错，但顺序取决于完成先后
+    await asyncio.gather(
+        test_text_parser(parser),
+        test_image_parser(parser),
+        test_audio_parser(parser),
+        test_tool_output_parser(parser),
+        test_mixed_content(parser),
+        test_quote_reply_resolver(parser),
+        test_system_prompt_parser(parser)
+    )
     
-    print("\n所有测试完成！")
+    if VERBOSE:
+        print("\n所有测试完成！")
 
 if __name__ == "__main__":
     # 运行所有测试